@@ -38,6 +38,11 @@ ENABLE_ES = get_bool("LEEK_ENABLE_ES")
 ENABLE_API = get_bool("LEEK_ENABLE_API")
 ENABLE_AGENT = get_bool("LEEK_ENABLE_AGENT")
 ENABLE_WEB = get_bool("LEEK_ENABLE_WEB")
+ENABLE_EVENTS_LOG = get_bool("LEEK_API_EVENTS_LOG")
+ENABLE_INGESTION_POOL = get_bool("LEEK_API_INGESTION_POOL")
+LEEK_API_INGESTION_PORT = os.environ.get("LEEK_API_INGESTION_PORT", "5002")
+ENABLE_AIO = get_bool("LEEK_API_AIO")
+LEEK_API_AIO_PORT = os.environ.get("LEEK_API_AIO_PORT", "5001")
 LEEK_ES_URL = os.environ.get("LEEK_ES_URL", "http://0.0.0.0:9200")
 LEEK_API_URL = os.environ.get("LEEK_API_URL", "http://0.0.0.0:5000")
 LEEK_WEB_URL = os.environ.get("LEEK_WEB_URL", "http://0.0.0.0:8000")
@@ -133,7 +138,13 @@ if ENABLE_AGENT:
                     abort("Agent and API are both enabled in same container, LEEK_AGENT_API_SECRET env variable should "
                           "be specified for inter-communication between agent and API")
                 # Use local API URL not from LEEK_API_URL env var, LEEK_API_URL is used by Web app (browser)
-                subscription["api_url"] = "http://0.0.0.0:5000"
+                # Events are sent to the asyncio ingestion server or to the ingestion pool when they are enabled
+                if ENABLE_AIO:
+                    subscription["api_url"] = f"http://0.0.0.0:{LEEK_API_AIO_PORT}"
+                elif ENABLE_INGESTION_POOL:
+                    subscription["api_url"] = f"http://0.0.0.0:{LEEK_API_INGESTION_PORT}"
+                else:
+                    subscription["api_url"] = "http://0.0.0.0:5000"
 
         # Validate each subscription
         for subscription_name, subscription in subscriptions.items():
@@ -181,6 +192,17 @@ if ENABLE_API:
     subprocess.run(["supervisorctl", "start", "api"])
     # Make sure the API is up before starting the agent
     ensure_connection(f"{LEEK_API_URL}/v1/events/process")
+    if ENABLE_INGESTION_POOL:
+        # Start agents events pool, separate from dashboard queries
+        subprocess.run(["supervisorctl", "start", "ingestion"])
+        ensure_connection(f"http://0.0.0.0:{LEEK_API_INGESTION_PORT}/v1/events/process")
+    if ENABLE_AIO:
+        # Start asyncio ingestion server
+        subprocess.run(["supervisorctl", "start", "aio"])
+        ensure_connection(f"http://0.0.0.0:{LEEK_API_AIO_PORT}/v1/events/process")
+    if ENABLE_EVENTS_LOG:
+        # Fold appended events into tasks/workers docs
+        subprocess.run(["supervisorctl", "start", "materializer"])
 
 if ENABLE_AGENT:
     # Start agent.
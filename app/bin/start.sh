@@ -5,6 +5,9 @@ ENABLE_ES=$(echo "${LEEK_ENABLE_ES-false}" | tr '[:upper:]' '[:lower:]')
 ENABLE_API=$(echo "${LEEK_ENABLE_API-false}" | tr '[:upper:]' '[:lower:]')
 ENABLE_AGENT=$(echo "${LEEK_ENABLE_AGENT-false}" | tr '[:upper:]' '[:lower:]')
 ENABLE_WEB=$(echo "${LEEK_ENABLE_WEB-false}" | tr '[:upper:]' '[:lower:]')
+ENABLE_EVENTS_LOG=$(echo "${LEEK_API_EVENTS_LOG-false}" | tr '[:upper:]' '[:lower:]')
+ENABLE_INGESTION_POOL=$(echo "${LEEK_API_INGESTION_POOL-false}" | tr '[:upper:]' '[:lower:]')
+ENABLE_AIO=$(echo "${LEEK_API_AIO-false}" | tr '[:upper:]' '[:lower:]')
 
 case ${SERVICE} in
 
@@ -16,7 +19,25 @@ case ${SERVICE} in
 
   "api")
     if [ "${ENABLE_API}" = true ]; then
-      exec gunicorn --reload -c /opt/app/leek/api/server/gunicorn.py leek.api.server.wsgi:app
+      LEEK_API_POOL=query exec gunicorn --reload -c /opt/app/leek/api/server/gunicorn.py leek.api.server.wsgi:app
+    fi
+    ;;
+
+  "ingestion")
+    if [ "${ENABLE_API}" = true ] && [ "${ENABLE_INGESTION_POOL}" = true ]; then
+      LEEK_API_POOL=ingestion exec gunicorn --reload -c /opt/app/leek/api/server/gunicorn.py leek.api.server.wsgi:app
+    fi
+    ;;
+
+  "aio")
+    if [ "${ENABLE_API}" = true ] && [ "${ENABLE_AIO}" = true ]; then
+      exec python -m leek.api.server.aio
+    fi
+    ;;
+
+  "materializer")
+    if [ "${ENABLE_API}" = true ] && [ "${ENABLE_EVENTS_LOG}" = true ]; then
+      exec python -m leek.api.materializer
     fi
     ;;
 
@@ -41,7 +62,7 @@ case ${SERVICE} in
     ;;
 
   *)
-    echo "Service must one of [es, api, agent, web]!"
+    echo "Service must one of [es, api, ingestion, aio, materializer, agent, web]!"
     exit 1
     ;;
 esac
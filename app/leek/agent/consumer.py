@@ -1,3 +1,5 @@
+import hashlib
+import json
 import time
 from urllib.parse import urljoin
 
@@ -14,9 +16,17 @@ class LeekConsumer(ConsumerMixin):
     PREFETCH_COUNT = 20
     MAX_RETRIES = 1000
     SUCCESS_STATUS_CODES = [200, 201]
-    BACKOFF_STATUS_CODES = [400, 404, 503]
+    # Some events were rejected by the API and quarantined, they should not be retried
+    PARTIAL_STATUS_CODES = [207]
+    BACKOFF_STATUS_CODES = [400, 404, 409, 503]
+    THROTTLE_STATUS_CODES = [429]
     DOWN_DELAY_S = 20
     BACKOFF_DELAY_S = 5
+    # Pacing between requests, grows when the API pushes back and shrinks back on success
+    MIN_PACING_DELAY_S = 0.01
+    MAX_PACING_DELAY_S = 5
+    PACING_INCREASE_FACTOR = 2
+    PACING_DECREASE_FACTOR = 0.8
     LEEK_WEBHOOKS_ENDPOINT = "/v1/events/process"
 
     def __init__(
@@ -52,6 +62,7 @@ class LeekConsumer(ConsumerMixin):
         logger.info(f"Building consumer for subscription [{subscription_name}]...")
 
         self.api_url = api_url
+        self.pacing_delay = 0
         self.headers = {
             "x-requested-with": "leek-agent",
             "x-agent-version": "1.0.0",
@@ -107,6 +118,29 @@ class LeekConsumer(ConsumerMixin):
         logger.info("Consumer created!")
         return [consumer]
 
+    def slow_down(self, response):
+        """
+        Honor API backpressure, wait for the Retry-After hint and pace next requests
+        """
+        try:
+            retry_after = float(response.headers.get("Retry-After", self.BACKOFF_DELAY_S))
+        except ValueError:
+            retry_after = self.BACKOFF_DELAY_S
+        self.pacing_delay = min(
+            self.MAX_PACING_DELAY_S,
+            max(self.MIN_PACING_DELAY_S, self.pacing_delay * self.PACING_INCREASE_FACTOR)
+        )
+        logger.warning(
+            f"Leek API is overloaded, backoff for {retry_after} seconds and pace requests "
+            f"every {self.pacing_delay:.2f} seconds."
+        )
+        time.sleep(retry_after)
+
+    def speed_up(self):
+        self.pacing_delay *= self.PACING_DECREASE_FACTOR
+        if self.pacing_delay < self.MIN_PACING_DELAY_S:
+            self.pacing_delay = 0
+
     def on_message(self, body, message):
         """
         Callbacks used to send message to Leek API Webhooks endpoint
@@ -114,12 +148,18 @@ class LeekConsumer(ConsumerMixin):
         :param message: Message
         """
         # print(message.properties)
+        # The batch id is a digest of the body, so redelivered messages and retries are acknowledged by the API
+        # without being merged again
+        batch_id = hashlib.sha1(json.dumps(body, sort_keys=True, default=str).encode()).hexdigest()
+        headers = {**self.headers, "x-leek-batch-id": batch_id}
         for i in range(self.MAX_RETRIES):
+            if self.pacing_delay:
+                time.sleep(self.pacing_delay)
             try:
                 response = requests.post(
                     url=urljoin(self.api_url, self.LEEK_WEBHOOKS_ENDPOINT),
                     json=body,
-                    headers=self.headers
+                    headers=headers
                 )
                 response.raise_for_status()  # Raises a HTTPError if the status is 4xx, 5xxx
             except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
@@ -127,7 +167,9 @@ class LeekConsumer(ConsumerMixin):
                 time.sleep(self.DOWN_DELAY_S)
             except requests.exceptions.HTTPError as e:
                 status_code = e.response.status_code
-                if status_code in self.BACKOFF_STATUS_CODES:
+                if status_code in self.THROTTLE_STATUS_CODES or "Retry-After" in e.response.headers:
+                    self.slow_down(e.response)
+                elif status_code in self.BACKOFF_STATUS_CODES:
                     logger.warning(e.response.content)
                     logger.warning(
                         f"Failed to send message with status code {status_code}, "
@@ -138,6 +180,9 @@ class LeekConsumer(ConsumerMixin):
                     logger.error(e.response.content)
                     time.sleep(self.DOWN_DELAY_S)
             else:
-                if response.status_code in self.SUCCESS_STATUS_CODES:
+                if response.status_code in self.PARTIAL_STATUS_CODES:
+                    logger.warning(f"Leek API rejected some events: {response.json().get('rejected')}")
+                if response.status_code in self.SUCCESS_STATUS_CODES + self.PARTIAL_STATUS_CODES:
+                    self.speed_up()
                     message.ack()
                     return
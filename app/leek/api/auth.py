@@ -1,43 +1,94 @@
+import hashlib
+import re
+import threading
 import time
 
 import requests
-from cachecontrol import CacheControl
-from cachecontrol.caches import FileCache
-from jose import jwt, jws, JWTError
+from jose import jwt, jws, jwk, JWTError
 from jose.utils import base64url_decode
 
+from leek.api.cache import TTLCache
 from leek.api.conf import settings
 
 _CERT_URL = "https://www.googleapis.com/service_accounts/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+_CERT_DEFAULT_MAX_AGE = 3600
+_MAX_AGE_PATTERN = re.compile(r"max-age=(\d+)")
+# Unknown kids force a keys refresh at most once per interval, so tokens with random kids can not make each
+# request block on Google's endpoint
+_MIN_FORCED_REFRESH_INTERVAL_S = 60
+
+# Parsed public keys by kid, refreshed according to the certs response max-age
+_public_keys = {}
+_public_keys_expire_at = 0
+_public_keys_fetched_at = 0
+_public_keys_lock = threading.Lock()
+# Verified claims by token hash, kept until the token expires
+_verified_tokens = TTLCache(maxsize=4096)
+
+
+class KeyNotFoundError(JWTError):
+    pass
 
 
 def search_for_key(token, keys):
     # get the kid from the headers prior to verification
     headers = jwt.get_unverified_headers(token)
+    if headers.get("alg") != "RS256":
+        raise JWTError("Unsupported token algorithm")
     kid = headers["kid"]
     # search for the kid in the downloaded public keys
-    for key in keys:
-        if kid == key["kid"]:
-            return key
-    raise JWTError(f"Public key not found in provided keys")
+    try:
+        return keys[kid]
+    except KeyError:
+        raise KeyNotFoundError("Public key not found in provided keys")
 
 
-def get_public_key(token):
+def fetch_public_keys():
+    """
+    Download and parse Google's public keys, they are only changed infrequently (on the order of once per day)
+    :return: parsed keys by kid and their max-age in seconds
+    """
+    response = requests.get(_CERT_URL, timeout=10)
+    response.raise_for_status()
+    keys = {kid: jwk.construct(pem, "RS256") for kid, pem in response.json().items()}
+    max_age = _MAX_AGE_PATTERN.search(response.headers.get("Cache-Control", ""))
+    return keys, int(max_age.group(1)) if max_age else _CERT_DEFAULT_MAX_AGE
+
+
+def get_public_keys(force=False):
     """
-    Because Google's public keys are only changed infrequently (on the order of once per day),
-    we can take advantage of caching to reduce latency and the potential for network errors.
+    Because Google's public keys are only changed infrequently, they are kept in memory until the certs
+    response max-age expires, to avoid network round trips and keys parsing on each request.
+    :param force: refresh keys before max-age expiry, unless they were fetched in the last interval
     """
-    sess = CacheControl(requests.Session(), cache=FileCache('/tmp/firebase-certs-cache'))
-    request = sess.get(_CERT_URL)
-    ks = request.json()
-    keys = []
-    for k, v in ks.items():
-        keys.append({
-            "alg": "RS256",
-            "kid": k,
-            "pem": v
-        })
-    return search_for_key(token, keys)
+    global _public_keys, _public_keys_expire_at, _public_keys_fetched_at
+    if not force and _public_keys and time.time() < _public_keys_expire_at:
+        return _public_keys
+    with _public_keys_lock:
+        forced = force and time.time() - _public_keys_fetched_at >= _MIN_FORCED_REFRESH_INTERVAL_S
+        if forced or not _public_keys or time.time() >= _public_keys_expire_at:
+            _public_keys, max_age = fetch_public_keys()
+            _public_keys_fetched_at = time.time()
+            _public_keys_expire_at = _public_keys_fetched_at + max_age
+    return _public_keys
+
+
+def prefetch_public_keys():
+    """
+    Warm up public keys at startup so the first request does not block on Google's endpoint
+    """
+    try:
+        get_public_keys()
+    except requests.exceptions.RequestException as e:
+        print(f"Unable to prefetch public keys: {e}")
+
+
+def get_public_key(token):
+    try:
+        return search_for_key(token, get_public_keys())
+    except KeyNotFoundError:
+        # Keys may have been rotated before max-age expiry
+        return search_for_key(token, get_public_keys(force=True))
 
 
 def valid_signature(token, key):
@@ -88,6 +139,12 @@ def verify(token):
 
 
 def decode_jwt_token(token):
+    token_hash = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    claims = _verified_tokens.get(token_hash)
+    if claims and time.time() < claims["exp"]:
+        return claims
     claims = verify(token)
     if claims:
+        # Claims are cached until the token expires
+        _verified_tokens.set(token_hash, claims, ttl=claims["exp"] - time.time())
         return claims
@@ -0,0 +1,65 @@
+import math
+import time
+import threading
+
+from leek.api.conf import settings
+
+
+class IngestionPressure:
+    """
+    Per process ingestion load, measured from the number of in flight ingestion requests
+    and the recent ES merge latency. A load >= 1 means the API should push back on agents.
+    """
+    # Weight of the latest latency sample in the moving average
+    LATENCY_SMOOTHING = 0.2
+    # Latency samples older than this are progressively ignored, so the load recovers when nothing is written
+    LATENCY_WINDOW_S = 10
+
+    def __init__(self, max_inflight, max_latency_s, max_retry_after_s):
+        self.max_inflight = max_inflight
+        self.max_latency_s = max_latency_s
+        self.max_retry_after_s = max_retry_after_s
+        self.inflight = 0
+        self.latency_s = 0.
+        self.latency_sampled_at = 0.
+        self._lock = threading.Lock()
+
+    def enter(self):
+        with self._lock:
+            self.inflight += 1
+
+    def exit(self):
+        with self._lock:
+            self.inflight -= 1
+
+    def record_latency(self, seconds):
+        with self._lock:
+            self.latency_s += self.LATENCY_SMOOTHING * (seconds - self.latency_s)
+            self.latency_sampled_at = time.monotonic()
+
+    def recent_latency(self):
+        age = time.monotonic() - self.latency_sampled_at
+        return self.latency_s * max(0., 1 - age / self.LATENCY_WINDOW_S)
+
+    def load(self):
+        return max(self.inflight / self.max_inflight, self.recent_latency() / self.max_latency_s)
+
+    def retry_after(self):
+        """
+        Seconds agents should wait before retrying, grows with the overload
+        """
+        return min(self.max_retry_after_s, max(1, math.ceil(self.load())))
+
+    def stats(self):
+        return {
+            "inflight": self.inflight,
+            "latency_ms": int(self.recent_latency() * 1000),
+            "load": round(self.load(), 2),
+        }
+
+
+pressure = IngestionPressure(
+    max_inflight=settings.LEEK_API_INGESTION_MAX_INFLIGHT,
+    max_latency_s=settings.LEEK_API_INGESTION_MAX_LATENCY_MS / 1000,
+    max_retry_after_s=settings.LEEK_API_INGESTION_MAX_RETRY_AFTER_S,
+)
@@ -0,0 +1,73 @@
+import threading
+import time
+from typing import Union
+
+from leek.api.conf import settings
+from leek.api.db.store import Task, Worker, FanoutTrigger
+from .slack import send_slack_digest
+
+
+class DigestAggregator:
+    """
+    Per process aggregation of notifications of triggers having an aggregation window.
+    Matched tasks are grouped by (trigger, env, task name, state, exception), a group is opened by its first task
+    and sent as one digest message when the trigger aggregation window is over.
+    """
+    FLUSH_INTERVAL_S = 1
+
+    def __init__(self, max_groups):
+        self.max_groups = max_groups
+        # group key -> digest
+        self._groups = {}
+        self._dropped = 0
+        self._lock = threading.Lock()
+        self._started = False
+
+    def start(self):
+        threading.Thread(target=self._run, name="digests", daemon=True).start()
+        self._started = True
+
+    def add(self, app_name, trigger: FanoutTrigger, event: Union[Task, Worker], note=None):
+        key = (trigger.slack_wh_url, trigger.id, app_name, event.app_env, event.name, event.state, event.exception)
+        with self._lock:
+            if not self._started:
+                self.start()
+            digest = self._groups.get(key)
+            if digest is None:
+                if len(self._groups) >= self.max_groups:
+                    self._dropped += 1
+                    return
+                digest = self._groups[key] = {
+                    "app_env": event.app_env,
+                    "name": event.name,
+                    "state": event.state,
+                    "exception": event.exception,
+                    "count": 0,
+                    "first_uuid": event.uuid,
+                    "window": trigger.aggregation_window,
+                    "flush_at": time.monotonic() + trigger.aggregation_window,
+                }
+            digest["count"] += 1
+            digest["last_uuid"] = event.uuid
+            if note:
+                digest["note"] = note
+
+    def flush(self):
+        now = time.monotonic()
+        with self._lock:
+            due = [key for key, digest in self._groups.items() if digest["flush_at"] <= now]
+            digests = [(key, self._groups.pop(key)) for key in due]
+        for (wh_url, _, app_name, *_), digest in digests:
+            send_slack_digest(app_name, digest, wh_url)
+
+    def _run(self):
+        while True:
+            time.sleep(self.FLUSH_INTERVAL_S)
+            self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {"groups": len(self._groups), "dropped": self._dropped}
+
+
+aggregator = DigestAggregator(max_groups=settings.LEEK_API_DIGEST_MAX_GROUPS)
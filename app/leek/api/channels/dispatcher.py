@@ -0,0 +1,162 @@
+import threading
+import time
+from collections import deque
+
+import urllib3
+
+from leek.api import codec
+from leek.api.conf import settings
+
+
+class NotificationDispatcher:
+    """
+    Per process background delivery of webhook notifications, so ingestion only enqueues them.
+    - Connections are pooled per webhook host and shared by a bounded number of workers.
+    - Each webhook receives at most one message at a time and rate_per_s messages per second, a webhook
+      answering 429 is paused for its Retry-After delay, without delaying other webhooks.
+    - Failed deliveries are retried with an exponential backoff.
+    - When the queue is full, new notifications are dropped.
+    """
+    # Weight of the latest delivery latency in the moving average
+    LATENCY_SMOOTHING = 0.2
+
+    def __init__(self, max_queue, workers, max_retries, rate_per_s, timeout_s):
+        self.max_queue = max_queue
+        self.workers = workers
+        self.max_retries = max_retries
+        self.min_interval_s = 1 / rate_per_s
+        self.http = urllib3.PoolManager(
+            num_pools=100,
+            maxsize=workers,
+            retries=False,
+            timeout=urllib3.Timeout(connect=timeout_s, read=timeout_s),
+        )
+        # webhook url -> queued messages
+        self._pending = {}
+        # webhook url -> earliest time of next delivery
+        self._ready_at = {}
+        self._inflight = set()
+        self._depth = 0
+        self._counters = {"delivered": 0, "failed": 0, "dropped": 0, "throttled": 0}
+        self.latency_s = 0.
+        self._cond = threading.Condition()
+        self._started = False
+
+    def start(self):
+        for i in range(self.workers):
+            threading.Thread(target=self._work, name=f"notifications-{i}", daemon=True).start()
+        self._started = True
+
+    def submit(self, wh_url, body):
+        with self._cond:
+            if not self._started:
+                self.start()
+            if self._depth >= self.max_queue:
+                self._counters["dropped"] += 1
+                return False
+            self._pending.setdefault(wh_url, deque()).append({"body": body, "attempts": 0, "at": time.monotonic()})
+            self._depth += 1
+            self._cond.notify()
+            return True
+
+    def _next(self):
+        """
+        Wait for the queued message of the webhook ready the earliest
+        """
+        with self._cond:
+            while True:
+                candidates = [(self._ready_at.get(url, 0), url) for url in self._pending if url not in self._inflight]
+                if not candidates:
+                    self._cond.wait()
+                    continue
+                ready_at, wh_url = min(candidates)
+                wait_time = ready_at - time.monotonic()
+                if wait_time > 0:
+                    self._cond.wait(timeout=wait_time)
+                    continue
+                queue = self._pending[wh_url]
+                message = queue.popleft()
+                if not queue:
+                    del self._pending[wh_url]
+                self._inflight.add(wh_url)
+                return wh_url, message
+
+    def _done(self, wh_url, message, delay_s, outcome, retry=False):
+        with self._cond:
+            if outcome:
+                self._counters[outcome] += 1
+            if outcome == "delivered":
+                self.latency_s += self.LATENCY_SMOOTHING * (time.monotonic() - message["at"] - self.latency_s)
+            self._inflight.discard(wh_url)
+            self._ready_at[wh_url] = time.monotonic() + delay_s
+            if retry:
+                self._pending.setdefault(wh_url, deque()).appendleft(message)
+            else:
+                self._depth -= 1
+                self._ready_at = {url: t for url, t in self._ready_at.items() if t > time.monotonic()}
+            self._cond.notify_all()
+
+    @staticmethod
+    def _retry_after(response):
+        try:
+            return max(0., float(response.headers.get("Retry-After", 1)))
+        except ValueError:
+            # HTTP date or invalid value
+            return 1.
+
+    def _deliver(self, wh_url, message):
+        """
+        :return: delay before the next delivery to the webhook, outcome and whether the message is retried
+        """
+        try:
+            response = self.http.request(
+                "POST",
+                wh_url,
+                headers={"Accept": "application/json", "Content-Type": "application/json"},
+                body=codec.dumps(message["body"]),
+            )
+            status = response.status
+        except urllib3.exceptions.HTTPError as e:
+            print("Request to webhook returned an error:", e)
+            status = None
+        if status == 429:
+            # Honor webhook rate limit without consuming a retry
+            return self._retry_after(response), "throttled", True
+        elif status is not None and status < 400:
+            return self.min_interval_s, "delivered", False
+        elif status is not None and status < 500:
+            print(f"Webhook rejected notification with status {status}")
+            return self.min_interval_s, "failed", False
+        elif message["attempts"] < self.max_retries:
+            message["attempts"] += 1
+            return 2 ** message["attempts"], None, True
+        return self.min_interval_s, "failed", False
+
+    def _work(self):
+        while True:
+            wh_url, message = self._next()
+            try:
+                delay_s, outcome, retry = self._deliver(wh_url, message)
+            except Exception as e:
+                # The webhook is always released, so it is delivered to again
+                print(f"Unable to deliver notification: {e}")
+                delay_s, outcome, retry = self.min_interval_s, "failed", False
+            self._done(wh_url, message, delay_s, outcome, retry=retry)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "queue_depth": self._depth,
+                "delivering": len(self._inflight),
+                "latency_ms": int(self.latency_s * 1000),
+                **self._counters,
+            }
+
+
+dispatcher = NotificationDispatcher(
+    max_queue=settings.LEEK_API_NOTIFY_QUEUE_SIZE,
+    workers=settings.LEEK_API_NOTIFY_WORKERS,
+    max_retries=settings.LEEK_API_NOTIFY_MAX_RETRIES,
+    rate_per_s=settings.LEEK_API_NOTIFY_RATE_PER_S,
+    timeout_s=settings.LEEK_API_NOTIFY_TIMEOUT_S,
+)
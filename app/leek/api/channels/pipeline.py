@@ -1,7 +1,8 @@
-from typing import List, Union
-import re
+from typing import Dict, List, Optional, Union
 
 from leek.api.db.store import Task, Worker, Application, STATES_SUCCESS, EventKind
+from .aggregator import aggregator
+from .rates import evaluator
 from .slack import send_slack
 
 
@@ -9,45 +10,42 @@ class Channels:
     SLACK = "slack"
 
 
-def notify(app: Application, env, events: List[Union[Task, Worker]]):
-    fo_triggers = app.fo_triggers
-    if not len(fo_triggers):
+def notify(index_alias, app: Application, env, events: List[Union[Task, Worker]],
+           new_events: Optional[Dict[str, List[Union[Task, Worker]]]] = None):
+    """
+    Match events against the application triggers index, triggers are looked up once per (env, state).
+    Events are also counted for rate triggers, evaluated periodically
+    :param index_alias: index alias in the form of orgName-appName, rate counters are kept by application alias
+    :param events: merged docs
+    :param new_events: received events grouped by id, rate triggers only count tasks completed by them
+    """
+    if len(app.rate_triggers):
+        evaluator.record(index_alias, app, env, events, new_events)
+    else:
+        evaluator.forget(index_alias)
+    if not len(app.triggers_index):
         return
-    for trigger in fo_triggers:
-        envs = trigger.envs
-        # Skip: Trigger not enabled
-        if not trigger.enabled:
-            continue
-        # Skip: Env not matched
-        if len(envs) and env not in envs:
-            continue
-
-        states = trigger.states
-        exclusions = trigger.exclude
-        inclusions = trigger.include
-        runtime_upper_bound = trigger.runtime_upper_bound
-        for event in events:
-            note = None
-            state = event.state
-            # Skip: event is not related to task
-            if event.kind != EventKind.TASK:
-                continue
-            # Skip: State not matched
-            if len(states) and state not in states:
-                continue
-            # Skip: task excluded
-            if len(exclusions) and any(re.match(exclusion, event.name) for exclusion in exclusions):
-                continue
-            # Skip: task not included
-            elif len(inclusions) and any(re.match(inclusion, event.name) for inclusion in inclusions):
-                continue
-            if state in STATES_SUCCESS and runtime_upper_bound:
-                runtime = event.runtime or 0
-                # Skip: task runtime did not exceed runtime upper bound
-                if runtime <= runtime_upper_bound:
+    tasks_by_state = {}
+    for event in events:
+        # Skip: event is not related to task
+        if event.kind == EventKind.TASK:
+            tasks_by_state.setdefault(event.state, []).append(event)
+    for state, tasks in tasks_by_state.items():
+        for trigger in app.triggers_index.lookup(env, state):
+            for event in tasks:
+                note = None
+                # Skip: task excluded or not included
+                if not trigger.matches_name(event.name):
                     continue
-                else:
-                    note = f"Runtime upper bound exceeded: `{runtime} seconds`"
-            # Finally: notify
-            if trigger.type == Channels.SLACK:
-                send_slack(app.app_name, event, trigger.slack_wh_url, extra={"note": note})
+                if state in STATES_SUCCESS and trigger.runtime_upper_bound:
+                    runtime = event.runtime or 0
+                    # Skip: task runtime did not exceed runtime upper bound
+                    if runtime <= trigger.runtime_upper_bound:
+                        continue
+                    else:
+                        note = f"Runtime upper bound exceeded: `{runtime} seconds`"
+                # Finally: notify
+                if trigger.aggregation_window:
+                    aggregator.add(app.app_name, trigger, event, note=note)
+                elif trigger.type == Channels.SLACK:
+                    send_slack(app.app_name, event, trigger.slack_wh_url, extra={"note": note})
@@ -0,0 +1,153 @@
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Union
+
+from leek.api.conf import settings
+from leek.api.db.store import Task, Worker, Application, FanoutTrigger, RateMetric, EventKind, STATES_TERMINAL, \
+    STATES_EXCEPTION
+from .slack import send_slack_rate_alert
+
+STATES_FAILURE = STATES_TERMINAL & STATES_EXCEPTION
+
+
+class SlidingWindowCounters:
+    """
+    Per process tasks counters by (application, env, task name, state), kept in buckets of bucket_s seconds
+    for horizon_s seconds. Counts over any window are summed from the buckets, without querying ES.
+    """
+
+    def __init__(self, bucket_s, horizon_s):
+        self.bucket_s = bucket_s
+        self.horizon_s = horizon_s
+        # (index alias, env, task name) -> state -> bucket -> count
+        self._counters = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
+        self._lock = threading.Lock()
+
+    def bucket(self, now=None):
+        return int((now or time.time()) // self.bucket_s)
+
+    def record(self, index_alias, env, events: List[Union[Task, Worker]],
+               new_events: Optional[Dict[str, List[Union[Task, Worker]]]] = None):
+        """
+        Count completed tasks, a task is counted when its terminal event is received, so its doc rewritten by
+        later events (late task-received for example) is not counted again
+        :param events: merged docs
+        :param new_events: received events grouped by id, the merged docs are counted if None
+        """
+        bucket = self.bucket()
+        with self._lock:
+            for event in events:
+                if event.kind != EventKind.TASK or not event.name or event.state not in STATES_TERMINAL:
+                    continue
+                if new_events is not None and \
+                        not any(e.state in STATES_TERMINAL for e in new_events.get(event.id, [])):
+                    continue
+                self._counters[(index_alias, env, event.name)][event.state][bucket] += 1
+
+    def count(self, key, states, start_s, end_s):
+        """
+        :return: count of tasks in states, from start_s to end_s seconds ago
+        """
+        now = time.time()
+        first, last = self.bucket(now - end_s), self.bucket(now - start_s)
+        with self._lock:
+            counters = self._counters.get(key, {})
+            return sum(count for state in states for bucket, count in counters.get(state, {}).items()
+                       if first < bucket <= last)
+
+    def keys(self, index_alias):
+        with self._lock:
+            return [key for key in self._counters.keys() if key[0] == index_alias]
+
+    def prune(self):
+        oldest = self.bucket() - self.horizon_s // self.bucket_s
+        with self._lock:
+            for key in list(self._counters.keys()):
+                by_state = self._counters[key]
+                for state in list(by_state.keys()):
+                    for bucket in [b for b in by_state[state] if b <= oldest]:
+                        del by_state[state][bucket]
+                    if not by_state[state]:
+                        del by_state[state]
+                if not by_state:
+                    del self._counters[key]
+
+
+class RateEvaluator:
+    """
+    Periodic evaluation of applications rate triggers on the sliding window counters.
+    A trigger alerts at most once per window for each (env, task name).
+    """
+
+    def __init__(self, counters: SlidingWindowCounters, interval_s):
+        self.counters = counters
+        self.interval_s = interval_s
+        # index alias -> latest application, only applications having rate triggers
+        self._apps = {}
+        # (trigger id, env, task name) -> last alert time
+        self._alerted = {}
+        self._lock = threading.Lock()
+        self._started = False
+
+    def start(self):
+        threading.Thread(target=self._run, name="rate-triggers", daemon=True).start()
+        self._started = True
+
+    def record(self, index_alias, app: Application, env, events: List[Union[Task, Worker]],
+               new_events: Optional[Dict[str, List[Union[Task, Worker]]]] = None):
+        with self._lock:
+            if not self._started:
+                self.start()
+            self._apps[index_alias] = app
+        self.counters.record(index_alias, env, events, new_events)
+
+    def forget(self, index_alias):
+        """
+        Stop evaluating an application, after its rate triggers are removed or disabled
+        """
+        if index_alias in self._apps:
+            with self._lock:
+                self._apps.pop(index_alias, None)
+
+    def evaluate(self, index_alias, app: Application, trigger: FanoutTrigger):
+        rule = trigger.rate
+        now = time.time()
+        for key in self.counters.keys(index_alias):
+            _, env, name = key
+            if (len(trigger.envs) and env not in trigger.envs) or not rule.pattern.match(name):
+                continue
+            if now - self._alerted.get((trigger.id, env, name), 0) < rule.window:
+                continue
+            completed = self.counters.count(key, STATES_TERMINAL, 0, rule.window)
+            if rule.metric == RateMetric.FAILURE_RATE:
+                if completed < rule.min_count:
+                    continue
+                value = self.counters.count(key, STATES_FAILURE, 0, rule.window) / completed
+            elif rule.metric == RateMetric.THROUGHPUT_DROP:
+                previous = self.counters.count(key, STATES_TERMINAL, rule.window, 2 * rule.window)
+                if previous < rule.min_count:
+                    continue
+                value = 1 - completed / previous
+            else:
+                continue
+            if value > rule.threshold:
+                self._alerted[(trigger.id, env, name)] = now
+                send_slack_rate_alert(app.app_name, env, name, rule, value, trigger.slack_wh_url)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval_s)
+            with self._lock:
+                apps = list(self._apps.items())
+            for index_alias, app in apps:
+                for trigger in app.rate_triggers:
+                    self.evaluate(index_alias, app, trigger)
+            self.counters.prune()
+            self._alerted = {key: t for key, t in self._alerted.items() if time.time() - t < self.counters.horizon_s}
+
+
+evaluator = RateEvaluator(
+    counters=SlidingWindowCounters(bucket_s=settings.LEEK_API_RATE_BUCKET_S, horizon_s=3600),
+    interval_s=settings.LEEK_API_RATE_EVAL_INTERVAL_S,
+)
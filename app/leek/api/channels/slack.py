@@ -1,8 +1,6 @@
-import json
 from typing import Union
 
-import urllib3
-
+from leek.api.channels.dispatcher import dispatcher
 from leek.api.db.store import Task, Worker, STATES_SUCCESS, STATES_EXCEPTION, STATES_UNREADY
 from leek.api.conf import settings
 
@@ -59,18 +57,120 @@ def send_slack(app_name: str, event: Union[Task, Worker], wh_url: str, extra: di
             {
                 "color": get_color(event.state),
                 "title": f"Task: {event.name}",
-                "title_link": f"{settings.LEEK_WEB_URL}/tasks?app={app_name}&uuid={event.uuid}",
+                "title_link": task_link(app_name, event.uuid),
                 "fields": fields,
             },
         ],
     }
-    http = urllib3.PoolManager()
-    try:
-        http.request(
-            "POST",
-            wh_url,
-            headers={"Accept": "application/json", "Content-Type": "application/json"},
-            body=json.dumps(body)
+    # Delivered in background
+    if not dispatcher.submit(wh_url, body):
+        print(f"Notifications queue is full, dropped {app_name} notification")
+
+
+def task_link(app_name, uuid):
+    return f"{settings.LEEK_WEB_URL}/tasks?app={app_name}&uuid={uuid}"
+
+
+def send_slack_digest(app_name: str, digest: dict, wh_url: str):
+    """
+    Send one message for a group of matched tasks (same name, state and exception) of an aggregation window
+    """
+    fields = [
+        {
+            "title": "Application",
+            "value": app_name,
+            "short": True,
+        },
+        {
+            "title": "Environment",
+            "value": digest["app_env"],
+            "short": True,
+        },
+        {
+            "title": "Task state",
+            "value": digest["state"],
+            "short": True,
+        },
+        {
+            "title": "Occurrences",
+            "value": f"{digest['count']} in {digest['window']:g} seconds",
+            "short": True,
+        },
+        {
+            "title": "First task uuid",
+            "value": f"<{task_link(app_name, digest['first_uuid'])}|{digest['first_uuid']}>",
+            "short": False,
+        },
+        {
+            "title": "Last task uuid",
+            "value": f"<{task_link(app_name, digest['last_uuid'])}|{digest['last_uuid']}>",
+            "short": False,
+        },
+    ]
+    if digest.get("exception"):
+        fields.append(
+            {
+                "title": "Exception",
+                "value": digest["exception"],
+                "short": False,
+            }
+        )
+    if digest.get("note"):
+        fields.append(
+            {
+                "title": "Note",
+                "value": digest["note"],
+                "short": False,
+            }
         )
-    except urllib3.exceptions.HTTPError as e:
-        print('Request to slack returned an error:', e.reason)
+    body = {
+        "attachments": [
+            {
+                "color": get_color(digest["state"]),
+                "title": f"Task: {digest['name']} ({digest['count']}x)",
+                "title_link": task_link(app_name, digest["last_uuid"]),
+                "fields": fields,
+            },
+        ],
+    }
+    if not dispatcher.submit(wh_url, body):
+        print(f"Notifications queue is full, dropped {app_name} digest")
+
+
+def send_slack_rate_alert(app_name: str, app_env: str, task_name: str, rule, value: float, wh_url: str):
+    """
+    Send a rate trigger alert, value and threshold are ratios
+    """
+    body = {
+        "attachments": [
+            {
+                "color": "danger",
+                "title": f"Task: {task_name}",
+                "title_link": f"{settings.LEEK_WEB_URL}/tasks?app={app_name}",
+                "fields": [
+                    {
+                        "title": "Application",
+                        "value": app_name,
+                        "short": True,
+                    },
+                    {
+                        "title": "Environment",
+                        "value": app_env,
+                        "short": True,
+                    },
+                    {
+                        "title": rule.metric.replace("_", " ").capitalize(),
+                        "value": f"{value:.1%} over the last {rule.window} seconds",
+                        "short": True,
+                    },
+                    {
+                        "title": "Threshold",
+                        "value": f"{rule.threshold:.1%}",
+                        "short": True,
+                    },
+                ],
+            },
+        ],
+    }
+    if not dispatcher.submit(wh_url, body):
+        print(f"Notifications queue is full, dropped {app_name} rate alert")
@@ -0,0 +1,28 @@
+"""
+JSON codec used by request parsing, responses rendering, ES client and notifications.
+orjson is used when available, otherwise the standard library json module.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+NAME = "orjson" if orjson else "json"
+
+
+def dumps(obj) -> str:
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj).decode("utf-8")
+        except TypeError:
+            # Unsupported types (Decimal, non str keys, ...) are left to the standard library
+            pass
+    return json.dumps(obj)
+
+
+def loads(s):
+    if orjson is not None:
+        return orjson.loads(s)
+    return json.loads(s)
@@ -10,8 +10,100 @@ def get_bool(env_name):
     return os.environ.get(env_name) == "true"
 
 
+def get_int(env_name, default):
+    return int(os.environ.get(env_name, default))
+
+
+def get_float(env_name, default):
+    return float(os.environ.get(env_name, default))
+
+
 # ES
 LEEK_ES_URL = os.environ.get("LEEK_ES_URL")
+LEEK_ES_TIMEOUT_S = get_int("LEEK_ES_TIMEOUT_S", 10)
+
+# ES circuit breaker (per API process)
+LEEK_ES_BREAKER_ERROR_RATE = get_float("LEEK_ES_BREAKER_ERROR_RATE", 0.5)
+LEEK_ES_BREAKER_MIN_CALLS = get_int("LEEK_ES_BREAKER_MIN_CALLS", 20)
+LEEK_ES_BREAKER_WINDOW_S = get_int("LEEK_ES_BREAKER_WINDOW_S", 30)
+LEEK_ES_BREAKER_SLOW_CALL_MS = get_int("LEEK_ES_BREAKER_SLOW_CALL_MS", 5000)
+LEEK_ES_BREAKER_OPEN_S = get_int("LEEK_ES_BREAKER_OPEN_S", 15)
+
+# Applications indices sorting, applied to new backing indices (empty field to disable)
+LEEK_API_INDEX_SORT_FIELD = os.environ.get("LEEK_API_INDEX_SORT_FIELD", "timestamp")
+LEEK_API_INDEX_SORT_ORDER = os.environ.get("LEEK_API_INDEX_SORT_ORDER", "desc")
+
+# Shards advisor targets, per primary shard
+LEEK_API_SHARD_MAX_INDEXING_RATE = get_float("LEEK_API_SHARD_MAX_INDEXING_RATE", 5000)
+LEEK_API_SHARD_TARGET_SIZE_GB = get_float("LEEK_API_SHARD_TARGET_SIZE_GB", 30)
+
+# Applications cache
+LEEK_API_APP_CACHE_TTL_S = get_float("LEEK_API_APP_CACHE_TTL_S", 30)
+LEEK_API_APP_CACHE_NEGATIVE_TTL_S = get_float("LEEK_API_APP_CACHE_NEGATIVE_TTL_S", 5)
+
+# Ingestion backpressure (per API process)
+LEEK_API_INGESTION_MAX_INFLIGHT = get_int("LEEK_API_INGESTION_MAX_INFLIGHT", 100)
+LEEK_API_INGESTION_MAX_LATENCY_MS = get_int("LEEK_API_INGESTION_MAX_LATENCY_MS", 3000)
+LEEK_API_INGESTION_MAX_RETRY_AFTER_S = get_int("LEEK_API_INGESTION_MAX_RETRY_AFTER_S", 30)
+
+# Applications ingestion quotas and fair scheduling of merges (per API process, 0 slots to disable scheduling)
+LEEK_API_QUOTA_BURST_S = get_float("LEEK_API_QUOTA_BURST_S", 2)
+LEEK_API_FAIR_SLOTS = get_int("LEEK_API_FAIR_SLOTS", 16)
+LEEK_API_FAIR_QUANTUM = get_int("LEEK_API_FAIR_QUANTUM", 500)
+LEEK_API_FAIR_MAX_WAIT_S = get_float("LEEK_API_FAIR_MAX_WAIT_S", 10)
+
+# Ingestion idempotency (shared by API processes, applied batch ids are also remembered per process)
+LEEK_API_IDEMPOTENCY_WINDOW_SIZE = get_int("LEEK_API_IDEMPOTENCY_WINDOW_SIZE", 10000)
+LEEK_API_IDEMPOTENCY_WINDOW_TTL_S = get_int("LEEK_API_IDEMPOTENCY_WINDOW_TTL_S", 600)
+LEEK_API_IDEMPOTENCY_IN_PROGRESS_TTL_S = get_int("LEEK_API_IDEMPOTENCY_IN_PROGRESS_TTL_S", 120)
+
+# Sampling: dropped tasks are remembered (per API process) to index them fully if they fail later
+LEEK_API_SAMPLING_REMEMBER_SIZE = get_int("LEEK_API_SAMPLING_REMEMBER_SIZE", 100000)
+LEEK_API_SAMPLING_REMEMBER_TTL_S = get_int("LEEK_API_SAMPLING_REMEMBER_TTL_S", 600)
+
+# Docs routing across rolled over backing indices (per API process)
+LEEK_API_ROUTING_TABLE_SIZE = get_int("LEEK_API_ROUTING_TABLE_SIZE", 100000)
+LEEK_API_ROUTING_TABLE_TTL_S = get_int("LEEK_API_ROUTING_TABLE_TTL_S", 3600)
+LEEK_API_WRITE_INDEX_TTL_S = get_int("LEEK_API_WRITE_INDEX_TTL_S", 30)
+
+# Events log: append raw events and materialize tasks/workers docs asynchronously
+LEEK_API_EVENTS_LOG = get_bool("LEEK_API_EVENTS_LOG")
+LEEK_MATERIALIZER_BATCH_SIZE = get_int("LEEK_MATERIALIZER_BATCH_SIZE", 5000)
+LEEK_MATERIALIZER_REBUILD_BATCH_SIZE = get_int("LEEK_MATERIALIZER_REBUILD_BATCH_SIZE", 10000)
+LEEK_MATERIALIZER_INTERVAL_S = get_float("LEEK_MATERIALIZER_INTERVAL_S", 1)
+LEEK_MATERIALIZER_LAG_S = get_float("LEEK_MATERIALIZER_LAG_S", 5)
+LEEK_MATERIALIZER_RETENTION_H = get_int("LEEK_MATERIALIZER_RETENTION_H", 0)
+
+# Process pool for CPU heavy work of big batches (opt-in, 0 to disable)
+LEEK_API_OFFLOAD_BATCH_SIZE = get_int("LEEK_API_OFFLOAD_BATCH_SIZE", 0)
+LEEK_API_OFFLOAD_WORKERS = get_int("LEEK_API_OFFLOAD_WORKERS", 2)
+
+# Bulk writes of merged docs (per API process)
+LEEK_API_BULK_TARGET_LATENCY_MS = get_int("LEEK_API_BULK_TARGET_LATENCY_MS", 500)
+LEEK_API_BULK_MIN_CHUNK_BYTES = get_int("LEEK_API_BULK_MIN_CHUNK_BYTES", 1048576)
+LEEK_API_BULK_MAX_CHUNK_BYTES = get_int("LEEK_API_BULK_MAX_CHUNK_BYTES", 10485760)
+LEEK_API_BULK_MAX_CHUNK_DOCS = get_int("LEEK_API_BULK_MAX_CHUNK_DOCS", 5000)
+LEEK_API_BULK_PARALLEL_THRESHOLD = get_int("LEEK_API_BULK_PARALLEL_THRESHOLD", 5000)
+LEEK_API_BULK_THREADS = get_int("LEEK_API_BULK_THREADS", 4)
+
+# Notifications delivery (per API process), Slack accepts about 1 message per second per webhook
+LEEK_API_NOTIFY_QUEUE_SIZE = get_int("LEEK_API_NOTIFY_QUEUE_SIZE", 10000)
+LEEK_API_NOTIFY_WORKERS = get_int("LEEK_API_NOTIFY_WORKERS", 4)
+LEEK_API_NOTIFY_MAX_RETRIES = get_int("LEEK_API_NOTIFY_MAX_RETRIES", 3)
+LEEK_API_NOTIFY_RATE_PER_S = get_float("LEEK_API_NOTIFY_RATE_PER_S", 1)
+LEEK_API_NOTIFY_TIMEOUT_S = get_float("LEEK_API_NOTIFY_TIMEOUT_S", 5)
+LEEK_API_DIGEST_MAX_GROUPS = get_int("LEEK_API_DIGEST_MAX_GROUPS", 10000)
+LEEK_API_RATE_BUCKET_S = get_int("LEEK_API_RATE_BUCKET_S", 10)
+LEEK_API_RATE_EVAL_INTERVAL_S = get_int("LEEK_API_RATE_EVAL_INTERVAL_S", 30)
+
+# Worker pools: query (all routes) or ingestion (agents events routes only)
+LEEK_API_POOL = os.environ.get("LEEK_API_POOL", "query")
+LEEK_API_INGESTION_POOL = get_bool("LEEK_API_INGESTION_POOL")
+LEEK_API_INGESTION_PORT = get_int("LEEK_API_INGESTION_PORT", 5002)
+
+# Optional asyncio ingestion server
+LEEK_API_AIO = get_bool("LEEK_API_AIO")
+LEEK_API_AIO_PORT = get_int("LEEK_API_AIO_PORT", 5001)
 
 # Authentication/Authorization
 LEEK_API_OWNER_ORG = os.environ["LEEK_API_OWNER_ORG"]
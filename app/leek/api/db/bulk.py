@@ -0,0 +1,111 @@
+import threading
+import time
+
+from elasticsearch.helpers import streaming_bulk, parallel_bulk
+
+from leek.api import codec
+from leek.api.conf import settings
+
+# Only what is needed to locate docs and report failures, indexed docs are not echoed back
+FILTER_PATH = "errors,items.*._index,items.*._id,items.*.status,items.*.error"
+
+
+class BulkWriter:
+    """
+    Per process bulk writer of merged docs.
+    - Sources are serialized once, so chunks are cut by their real byte size.
+    - The chunk byte size follows the observed write throughput, to keep each chunk round trip
+      around the target latency.
+    - Large batches are written by parallel chunks.
+    - Item failures are returned, they do not fail the other items of the batch.
+    """
+    # Weight of the latest throughput sample in the chunk size moving average
+    SMOOTHING = 0.3
+
+    def __init__(self, target_latency_s, min_chunk_bytes, max_chunk_bytes, max_chunk_docs,
+                 parallel_threshold, thread_count):
+        self.target_latency_s = target_latency_s
+        self.min_chunk_bytes = min_chunk_bytes
+        self.max_chunk_bytes = max_chunk_bytes
+        self.max_chunk_docs = max_chunk_docs
+        self.parallel_threshold = parallel_threshold
+        self.thread_count = thread_count
+        self.chunk_bytes = min_chunk_bytes
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def serialize(actions):
+        """
+        :return: actions with serialized sources and their total size in bytes
+        """
+        size = 0
+        for action in actions:
+            if "_source" in action:
+                action["_source"] = codec.dumps(action["_source"])
+                size += len(action["_source"])
+        return actions, size
+
+    def options(self):
+        return {
+            "chunk_size": self.max_chunk_docs,
+            "max_chunk_bytes": self.chunk_bytes,
+            "raise_on_error": False,
+            "raise_on_exception": True,
+            "filter_path": FILTER_PATH,
+        }
+
+    def record(self, size, seconds):
+        """
+        Adjust the chunk byte size to the observed throughput, writes much smaller than a chunk are
+        dominated by the round trip overhead and are not used
+        """
+        if size < self.chunk_bytes / 2 or seconds <= 0:
+            return
+        ideal = size / seconds * self.target_latency_s
+        with self._lock:
+            chunk_bytes = self.chunk_bytes + self.SMOOTHING * (ideal - self.chunk_bytes)
+            self.chunk_bytes = int(min(self.max_chunk_bytes, max(self.min_chunk_bytes, chunk_bytes)))
+
+    def should_parallelize(self, count, size):
+        return 0 < self.parallel_threshold <= count and size > self.chunk_bytes
+
+    def write(self, connection, actions):
+        """
+        Write actions in chunks, serially or in parallel for large batches
+        :return: (ok, item) bulk results in actions order
+        """
+        actions, size = self.serialize(actions)
+        start_time = time.monotonic()
+        if self.should_parallelize(len(actions), size):
+            results = list(parallel_bulk(connection, actions, thread_count=self.thread_count, **self.options()))
+        else:
+            # Items rejected by busy ES nodes (429) are not retried here, retried items would be yielded out of
+            # actions order, they are reported as failed so agents retry the batch
+            results = list(streaming_bulk(connection, actions, **self.options()))
+        self.record(size, time.monotonic() - start_time)
+        log_failures(results)
+        return results
+
+    def stats(self):
+        return {"chunk_bytes": self.chunk_bytes}
+
+
+def log_failures(results):
+    failures = [item for ok, item in results if not ok and not is_missing_delete(item)]
+    if len(failures):
+        print(f"Unable to write {len(failures)} docs: {codec.dumps(failures[:3])}")
+
+
+def is_missing_delete(item):
+    # Docs dropped by sampling may have been deleted already
+    return "delete" in item and item["delete"].get("status") == 404
+
+
+writer = BulkWriter(
+    target_latency_s=settings.LEEK_API_BULK_TARGET_LATENCY_MS / 1000,
+    min_chunk_bytes=settings.LEEK_API_BULK_MIN_CHUNK_BYTES,
+    max_chunk_bytes=settings.LEEK_API_BULK_MAX_CHUNK_BYTES,
+    max_chunk_docs=settings.LEEK_API_BULK_MAX_CHUNK_DOCS,
+    parallel_threshold=settings.LEEK_API_BULK_PARALLEL_THRESHOLD,
+    thread_count=settings.LEEK_API_BULK_THREADS,
+)
@@ -0,0 +1,111 @@
+import json
+import time
+
+from elasticsearch import exceptions as es_exceptions
+from elasticsearch.helpers import bulk, errors as bulk_errors
+
+from leek.api.errors import responses
+from leek.api.ext import es
+
+# Indices already created by this process
+_created_indices = set()
+
+mappings = {
+    "dynamic": False,
+    "properties": {
+        "app_env": {
+            "type": "keyword",
+        },
+        "timestamp": {
+            "type": "long",
+        },
+        "reason": {
+            "type": "text",
+        },
+        # Raw rejected event, kept for inspection only
+        "event": {
+            "type": "text",
+            "index": False,
+        },
+    }
+}
+
+
+def get_dead_letters_index(index_alias):
+    """
+    Org names can not contain underscores, so dead letters indices never match applications templates patterns
+    :param index_alias: index alias in the form of orgName-appName
+    """
+    return f"dead_letters-{index_alias}"
+
+
+def ensure_dead_letters_index(index_name):
+    if index_name in _created_indices:
+        return
+    try:
+        es.connection.indices.create(index_name, body={"mappings": mappings})
+    except es_exceptions.RequestError as e:
+        if e.error != "resource_already_exists_exception":
+            raise
+    _created_indices.add(index_name)
+
+
+def store_dead_letters(index_alias, app_env, rejected):
+    """
+    Quarantine rejected events, failures are only logged as they should not fail the accepted events
+    :param index_alias: index alias in the form of orgName-appName
+    :param app_env: events env
+    :param rejected: rejected events with the rejection reason
+    """
+    index_name = get_dead_letters_index(index_alias)
+    timestamp = int(time.time() * 1000)
+    actions = [
+        {
+            "_op_type": "index",
+            "_index": index_name,
+            "_source": {
+                "app_env": app_env,
+                "timestamp": timestamp,
+                "reason": r["reason"],
+                "event": json.dumps(r["event"], default=str),
+            },
+        } for r in rejected
+    ]
+    try:
+        ensure_dead_letters_index(index_name)
+        bulk(es.connection, actions)
+    except (es_exceptions.TransportError, bulk_errors.BulkIndexError) as e:
+        print(f"Unable to store {len(actions)} dead letters for {index_alias}: {e}")
+
+
+def get_dead_letters(index_alias, size=100, from_=0):
+    """
+    List application rejected events, newest first
+    :param index_alias: index alias in the form of orgName-appName
+    """
+    try:
+        d = es.connection.search(
+            index=get_dead_letters_index(index_alias),
+            body={"sort": [{"timestamp": "desc"}]},
+            size=size,
+            from_=from_,
+        )
+        return d, 200
+    except es_exceptions.ConnectionError:
+        return responses.cache_backend_unavailable
+    except es_exceptions.NotFoundError:
+        return {"hits": {"total": {"value": 0}, "hits": []}}, 200
+
+
+def purge_dead_letters(index_alias):
+    """
+    Delete application dead letters
+    :param index_alias: index alias in the form of orgName-appName
+    """
+    index_name = get_dead_letters_index(index_alias)
+    try:
+        es.connection.indices.delete(index_name, ignore_unavailable=True)
+        _created_indices.discard(index_name)
+        return "Done", 200
+    except es_exceptions.ConnectionError:
+        return responses.cache_backend_unavailable
@@ -1,58 +1,153 @@
-from typing import Dict, Union
+from typing import Dict, List, Union, Optional
 
 from elasticsearch import exceptions as es_exceptions
-from elasticsearch.helpers import streaming_bulk, errors as bulk_errors
 import json
+import time
 
-from leek.api.db.store import Task, Worker
+from leek.api.backpressure import pressure
+from leek.api.db.store import Task, Worker, Application
+from leek.api.db import routing
+from leek.api.db.bulk import writer
+from leek.api.db.merge import fold_many
 from leek.api.errors import responses
+from leek.api import offload
 from leek.api.ext import es
+from leek.api.sampling import sampler
 
 
 class RetrieveIndexedError(Exception):
     pass
 
 
-def retrieve_indexed(index_alias, new_events: Dict[str, Union[Task, Worker]]):
-    connection = es.connection
-    # Retrieving existing events
-    ids = []
-    for _id in new_events.keys():
-        ids.append(_id)
-    # Impossible
-    if len(ids) != len(set(ids)):
-        raise RetrieveIndexedError("Found events with the same id in the payload")
-    return connection.mget(
-        body={'ids': ids},
-        index=index_alias
-    )["docs"]
-
-
-def upsert_concurrently(index_alias, new_events: Dict[str, Union[Task, Worker]]):
-    indexed_events = retrieve_indexed(index_alias, new_events)
-    # Precedence check
-    updated = {}
-    for event in indexed_events:
-        # If the task is already indexed, update it
+def search_missing(index_alias, ids):
+    """
+    Targeted search of docs that are not in the write index, they may be in older backing indices
+    """
+    try:
+        hits = es.connection.search(
+            index=index_alias,
+            body={"query": {"ids": {"values": ids}}},
+            size=len(ids),
+        )["hits"]["hits"]
+    except es_exceptions.NotFoundError:
+        raise RetrieveIndexedError("Index not found")
+    return {hit["_id"]: {**hit, "found": True} for hit in hits}
+
+
+def locate(batches: Dict[str, Dict[str, List[Union[Task, Worker]]]]):
+    """
+    Build mget docs of new events, from their known backing index or from the write index
+    :return: index aliases and mget docs, in the same order
+    """
+    aliases = []
+    docs = []
+    for index_alias, new_events in batches.items():
+        for _id in new_events.keys():
+            aliases.append(index_alias)
+            docs.append({"_index": routing.resolve(index_alias, _id), "_id": _id})
+    return aliases, docs
+
+
+def collect_misses(aliases, indexed):
+    """
+    Misses of rolled over applications (many backing indices), they should be searched across the alias
+    :return: missing ids by index alias
+    """
+    misses = {}
+    for index_alias, doc in zip(aliases, indexed):
+        if "error" in doc:
+            # Stale location (deleted index), the doc is searched across the alias
+            routing.forget(index_alias, doc["_id"])
+            misses.setdefault(index_alias, []).append(doc["_id"])
+        elif not doc["found"] and routing.get_backing_indices(index_alias)[1] > 1:
+            misses.setdefault(index_alias, []).append(doc["_id"])
+    return misses
+
+
+def learn_locations(aliases, indexed, found):
+    """
+    Replace misses by docs found in older backing indices and learn docs locations, stale locations that were not
+    found across the alias are new docs
+    :return: (index alias, indexed doc) in the same order as aliases
+    """
+    indexed = [found.get(alias, {}).get(doc["_id"], {"_id": doc["_id"], "found": False} if "error" in doc else doc)
+               for alias, doc in zip(aliases, indexed)]
+    for index_alias, doc in zip(aliases, indexed):
+        if doc.get("found"):
+            routing.learn(index_alias, doc["_id"], doc["_index"])
+    return zip(aliases, indexed)
+
+
+def retrieve_indexed(batches: Dict[str, Dict[str, List[Union[Task, Worker]]]]):
+    """
+    Retrieve existing events of many applications in one round trip.
+    Docs are read from their known backing index or from the write index, and only misses of applications
+    having many backing indices (rolled over) are searched across the alias.
+    :param batches: new events grouped by id, by index alias
+    :return: (index alias, indexed doc) in the same order as batches
+    """
+    aliases, docs = locate(batches)
+    if not len(docs):
+        return []
+    indexed = es.connection.mget(body={"docs": docs})["docs"]
+    misses = collect_misses(aliases, indexed)
+    found = {index_alias: search_missing(index_alias, ids) for index_alias, ids in misses.items()}
+    return learn_locations(aliases, indexed, found)
+
+
+def prepare_fold(batches: Dict[str, Dict[str, List[Union[Task, Worker]]]], indexed_events):
+    """
+    :return: (index alias, id, found) keys and fold_many items, in the same order
+    """
+    keys = []
+    items = []
+    for index_alias, event in indexed_events:
+        # If the task is already indexed, fold the new events into it
         _id = event["_id"]
-        new_doc = new_events[_id]
         try:
             found = event["found"]
         except KeyError:
             raise RetrieveIndexedError("Index not found")
-        if found:
-            source = event["_source"]
-            if source["kind"] == "task":
-                task = Task(id=_id, **source, )
-                task.merge(new_doc)
-                updated[_id] = task
-            elif source["kind"] == "worker":
-                worker = Worker(id=_id, **source, )
-                worker.merge(new_doc)
-                updated[_id] = worker
-        else:
-            updated[_id] = new_doc
-    return updated
+        keys.append((index_alias, _id, found))
+        items.append((
+            _id,
+            event["_source"] if found else None,
+            None if found else sampler.recall(index_alias, _id),
+            batches[index_alias][_id],
+        ))
+    return keys, items
+
+
+def apply_sampling(batches, keys, docs, apps: Dict[str, Application]):
+    """
+    :return: docs to index by index alias, and (index alias, id) of indexed docs dropped by sampling
+    """
+    updated = {index_alias: {} for index_alias in batches.keys()}
+    dropped = []
+    for (index_alias, _id, found), doc in zip(keys, docs):
+        app = apps.get(index_alias)
+        weight = sampler.sample(index_alias, app.sampling_rules, doc) if app and app.sampling_rules else None
+        if weight == 0:
+            sampler.remember(index_alias, doc)
+            if found:
+                dropped.append((index_alias, _id))
+            continue
+        if weight:
+            doc.sample_weight = weight
+        updated[index_alias][_id] = doc
+    return updated, dropped
+
+
+def upsert_concurrently(batches: Dict[str, Dict[str, List[Union[Task, Worker]]]],
+                        apps: Optional[Dict[str, Application]] = None):
+    """
+    Fold new events into indexed docs and apply applications sampling rules
+    :return: docs to index by index alias, and (index alias, id) of indexed docs dropped by sampling
+    """
+    keys, items = prepare_fold(batches, retrieve_indexed(batches))
+    # Folding big batches is offloaded to the process pool
+    docs = offload.run(fold_many, items, size=sum(len(item[3]) for item in items))
+    return apply_sampling(batches, keys, docs, apps or {})
 
 
 def build_actions(index_alias: str, events: Dict[str, Union[Task, Worker]]):
@@ -62,33 +157,88 @@ def build_actions(index_alias: str, events: Dict[str, Union[Task, Worker]]):
         actions.append({
             "_id": _id,
             "_op_type": "index",
-            "_index": index_alias,
+            "_index": routing.resolve(index_alias, _id),
             "_source": doc,
         })
     return actions
 
 
-def merge_events(index_alias, events: Dict[str, Union[Task, Worker]]):
+def build_delete_actions(dropped):
+    return [{"_id": _id, "_op_type": "delete", "_index": routing.resolve(index_alias, _id)}
+            for index_alias, _id in dropped]
+
+
+def build_bulk(safe_events, dropped):
+    """
+    :return: (index alias, id) keys and bulk actions in the same order, delete actions have a None id
+    """
+    keys = []
+    actions = []
+    for index_alias, events in safe_events.items():
+        keys += [(index_alias, _id) for _id in events.keys()]
+        actions += build_actions(index_alias, events)
+    # Indexed docs of tasks dropped by sampling
+    keys += [(index_alias, None) for index_alias, _ in dropped]
+    actions += build_delete_actions(dropped)
+    return keys, actions
+
+
+def collect_updated(updated, safe_events, keys, results):
+    """
+    Learn locations of indexed docs and collect them by index alias, bulk results are yielded in actions order
+    (items are not retried by the bulk helpers) and their ids are checked against the actions ids.
+    Failed items are not notified, they are returned so only them are applied again when the batch is retried
+    :return: ids of docs that were not written, by index alias
+    """
+    failed = {}
+    for (ok, item), (index_alias, _id) in zip(results, keys):
+        if _id is None:
+            continue
+        result = item.get("index", {})
+        if ok and result.get("_id") == _id:
+            routing.learn(index_alias, _id, result["_index"])
+            updated[index_alias].append(safe_events[index_alias][_id])
+        else:
+            failed.setdefault(index_alias, []).append(_id)
+    return failed
+
+
+def merge_many(batches: Dict[str, Dict[str, List[Union[Task, Worker]]]],
+               apps: Optional[Dict[str, Application]] = None):
+    """
+    Merge events of many applications with one mget and one multi index bulk
+    :param batches: new events grouped by id, by index alias
+    :param apps: applications by index alias, to apply their sampling rules
+    :return: merged docs by index alias and ids of docs that were not written by index alias
+    """
     connection = es.connection
+    start_time = time.monotonic()
     try:
-        safe_events = upsert_concurrently(index_alias, events)
-        actions = build_actions(index_alias, safe_events)
+        safe_events, dropped = upsert_concurrently(batches, apps)
+        keys, actions = build_bulk(safe_events, dropped)
+        updated = {index_alias: [] for index_alias in batches.keys()}
+        failed = {}
         if len(actions):
-            updated = []
-            for ok, item in streaming_bulk(connection, actions, index=index_alias, _source=True):
-                if ok:
-                    _id = item["index"]["_id"]
-                    updated.append(safe_events[_id])
-            return updated, 201
-        else:
-            return [], 201
+            results = writer.write(connection, actions)
+            failed = collect_updated(updated, safe_events, keys, results)
+        return (updated, failed), 201
     except es_exceptions.ConnectionError:
         return responses.cache_backend_unavailable
     except es_exceptions.RequestError as e:
         print(json.dumps(e.info, indent=4))
         return f"Request error", 409
-    except bulk_errors.BulkIndexError as e:
-        print(json.dumps(e.errors, indent=4))
-        return f"Update error", 409
     except RetrieveIndexedError as e:
         return responses.application_not_found
+    finally:
+        pressure.record_latency(time.monotonic() - start_time)
+
+
+def merge_events(index_alias, events: Dict[str, List[Union[Task, Worker]]], app: Optional[Application] = None):
+    """
+    :return: merged docs and ids of docs that were not written
+    """
+    result, status = merge_many({index_alias: events}, {index_alias: app} if app else None)
+    if status == 201:
+        updated, failed = result
+        return (updated[index_alias], failed.get(index_alias, [])), status
+    return result, status
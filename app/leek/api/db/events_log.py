@@ -0,0 +1,197 @@
+import uuid
+from typing import Dict, List, Union
+
+from elasticsearch import exceptions as es_exceptions
+from elasticsearch.helpers import bulk, errors as bulk_errors
+
+from leek.api.db.store import Task, Worker
+from leek.api.errors import responses
+from leek.api.ext import es
+
+CHECKPOINTS_INDEX = "events_log_checkpoints"
+# Stamps logged events with the ES ingest time, which does not depend on API hosts clocks or bulk retries
+INGESTED_AT_PIPELINE = "events_log_ingested_at"
+
+# Indices already created by this process
+_created_indices = set()
+
+mappings = {
+    "dynamic": False,
+    "properties": {
+        # ES ingest time and a random tie breaker, used as materialization cursor
+        "ingested_at": {
+            "type": "date_nanos",
+        },
+        "tiebreak": {
+            "type": "keyword",
+        },
+        # Raw validated event, only kept in _source
+        "event": {
+            "type": "object",
+            "enabled": False,
+        },
+    }
+}
+
+
+def get_log_index(index_alias):
+    """
+    Org names can not contain underscores, so log indices never match applications templates patterns
+    :param index_alias: index alias in the form of orgName-appName
+    """
+    return f"events_log-{index_alias}"
+
+
+def ensure_ingested_at_pipeline():
+    es.connection.ingest.put_pipeline(INGESTED_AT_PIPELINE, body={
+        "description": "Stamp logged events with their ingest time",
+        "processors": [{"set": {"field": "ingested_at", "value": "{{_ingest.timestamp}}"}}],
+    })
+
+
+def ensure_log_index(index_name):
+    if index_name in _created_indices:
+        return
+    if not len(_created_indices):
+        ensure_ingested_at_pipeline()
+    try:
+        es.connection.indices.create(index_name, body={
+            "mappings": mappings,
+            "settings": {"refresh_interval": "1s", "index.default_pipeline": INGESTED_AT_PIPELINE},
+        })
+    except es_exceptions.RequestError as e:
+        if e.error != "resource_already_exists_exception":
+            raise
+    _created_indices.add(index_name)
+
+
+def to_log_doc(event: Union[Task, Worker]):
+    _id, doc = event.to_doc()
+    return {
+        "tiebreak": uuid.uuid4().hex,
+        "event": {"id": _id, **doc},
+    }
+
+
+def append_many(batches: Dict[str, Dict[str, List[Union[Task, Worker]]]]):
+    """
+    Append raw validated events of many applications to their events log, with pure bulk index and no reads.
+    Events are folded into tasks/workers docs later by the materializer.
+    :param batches: new events grouped by id, by index alias
+    """
+    actions = []
+    try:
+        for index_alias, events in batches.items():
+            index_name = get_log_index(index_alias)
+            ensure_log_index(index_name)
+            for group in events.values():
+                actions += [{"_op_type": "index", "_index": index_name, "_source": to_log_doc(e)} for e in group]
+        if len(actions):
+            bulk(es.connection, actions)
+        return "Appended", 201
+    except es_exceptions.ConnectionError:
+        return responses.cache_backend_unavailable
+    except bulk_errors.BulkIndexError as e:
+        print(f"Unable to append {len(e.errors)} events to events log")
+        return "Update error", 409
+
+
+def append_events(index_alias, events: Dict[str, List[Union[Task, Worker]]]):
+    return append_many({index_alias: events})
+
+
+def read_events(index_alias, after=None, size=5000, lag_s=5):
+    """
+    Read logged events in ingestion order
+    :param index_alias: index alias in the form of orgName-appName
+    :param after: cursor of the last read event
+    :param size: max events to read
+    :param lag_s: events ingested in the last lag_s seconds are not read yet, as they may not be searchable,
+    and reading them would move the cursor past events that are not visible yet. Ingest times are taken by ES
+    when the bulk request is processed, so API hosts clocks and retried bulk requests do not matter, but an event
+    becoming searchable more than lag_s seconds after its ingest time (refresh delayed by an overloaded cluster)
+    or ingest nodes clocks drifting by more than lag_s would be skipped
+    :return: raw events and the cursor of the last one
+    """
+    body = {
+        "query": {"range": {"ingested_at": {"lt": f"now-{int(lag_s * 1000)}ms"}}},
+        "sort": [{"ingested_at": "asc"}, {"tiebreak": "asc"}],
+    }
+    if after:
+        body["search_after"] = after
+    hits = es.connection.search(index=get_log_index(index_alias), body=body, size=size)["hits"]["hits"]
+    if not len(hits):
+        return [], after
+    return [hit["_source"]["event"] for hit in hits], hits[-1]["sort"]
+
+
+def get_pruned_mark_id(index_alias):
+    return f"{index_alias}:pruned"
+
+
+def prune_events_log(index_alias, after, retention_h):
+    """
+    Delete materialized events older than the retention. The application is marked as pruned first, as its log
+    can not be used to rebuild its docs anymore
+    :param index_alias: index alias in the form of orgName-appName
+    :param after: materialization checkpoint, events after it are kept
+    :param retention_h: hours materialized events are kept for
+    """
+    es.connection.index(index=CHECKPOINTS_INDEX, id=get_pruned_mark_id(index_alias),
+                        body={"pruned_before": f"now-{retention_h}h", "retention_h": retention_h})
+    es.connection.delete_by_query(
+        index=get_log_index(index_alias),
+        body={
+            "query": {
+                "bool": {
+                    "filter": [
+                        {"range": {"ingested_at": {"lt": after[0] // 1000000, "format": "epoch_millis"}}},
+                        {"range": {"ingested_at": {"lt": f"now-{retention_h}h"}}},
+                    ]
+                }
+            }
+        },
+        params=dict(wait_for_completion="false", conflicts="proceed"),
+    )
+
+
+def list_logged_applications():
+    try:
+        return [name[len("events_log-"):] for name in es.connection.indices.get_alias(index="events_log-*").keys()]
+    except es_exceptions.NotFoundError:
+        return []
+
+
+def get_checkpoint(index_alias):
+    try:
+        checkpoint = es.connection.get(index=CHECKPOINTS_INDEX, id=index_alias)["_source"]
+        return [checkpoint["ingested_at"], checkpoint["tiebreak"]]
+    except es_exceptions.NotFoundError:
+        return None
+
+
+def save_checkpoint(index_alias, after):
+    es.connection.index(index=CHECKPOINTS_INDEX, id=index_alias, body={"ingested_at": after[0], "tiebreak": after[1]})
+
+
+def is_pruned(index_alias):
+    """
+    :return: True if materialized events were deleted from the application events log
+    """
+    return es.connection.exists(index=CHECKPOINTS_INDEX, id=get_pruned_mark_id(index_alias))
+
+
+def reset_checkpoint(index_alias):
+    es.connection.delete(index=CHECKPOINTS_INDEX, id=index_alias, ignore=404)
+
+
+def delete_events_log(index_alias):
+    """
+    Delete application events log and its materialization checkpoint
+    :param index_alias: index alias in the form of orgName-appName
+    """
+    index_name = get_log_index(index_alias)
+    es.connection.indices.delete(index_name, ignore_unavailable=True)
+    reset_checkpoint(index_alias)
+    es.connection.delete(index=CHECKPOINTS_INDEX, id=get_pruned_mark_id(index_alias), ignore=404)
+    _created_indices.discard(index_name)
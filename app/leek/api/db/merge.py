@@ -0,0 +1,74 @@
+from collections import defaultdict
+from typing import Dict, List, Union, Iterable, Optional, Tuple
+
+from leek.api.db.store import Task, Worker, EventKind
+
+
+def event_order(event: Union[Task, Worker]):
+    return event.exact_timestamp, event.clock
+
+
+def group_events(events: Iterable[Union[Task, Worker]]) -> Dict[str, List[Union[Task, Worker]]]:
+    """
+    Group a batch of events by id (task uuid | worker hostname) and order each group by (timestamp, clock)
+    so that a batch holding many events of the same task/worker keeps all of them
+    :param events: validated events in arrival order
+    :return: ordered events per id
+    """
+    groups = defaultdict(list)
+    for event in events:
+        groups[event.id].append(event)
+    for group in groups.values():
+        group.sort(key=event_order)
+    return dict(groups)
+
+
+def merge_groups(target: Dict[str, List[Union[Task, Worker]]], groups: Dict[str, List[Union[Task, Worker]]]):
+    """
+    Merge groups of events into target groups keeping each group ordered by (timestamp, clock)
+    """
+    for _id, group in groups.items():
+        if _id in target:
+            target[_id] = sorted(target[_id] + group, key=event_order)
+        else:
+            target[_id] = group
+    return target
+
+
+def from_source(_id: str, source: dict) -> Union[Task, Worker, None]:
+    """
+    Build a task/worker object from an indexed document source
+    """
+    if source["kind"] == EventKind.TASK:
+        return Task(id=_id, **source, )
+    elif source["kind"] == EventKind.WORKER:
+        return Worker(id=_id, **source, )
+
+
+def fold(events: List[Union[Task, Worker]], base: Optional[Union[Task, Worker]] = None) -> Union[Task, Worker]:
+    """
+    Fold ordered events of the same id into one doc using Task/Worker merge semantics,
+    the result is the same as merging the events one by one into the indexed doc
+    :param events: events of the same id ordered by (timestamp, clock)
+    :param base: the currently indexed doc if any
+    :return: the merged doc
+    """
+    events = iter(events)
+    if base is None:
+        base = next(events)
+    for event in events:
+        base.merge(event)
+    return base
+
+
+def fold_many(items: List[Tuple[str, Optional[dict], Optional[Union[Task, Worker]], List[Union[Task, Worker]]]]):
+    """
+    Fold many groups of events, picklable so it can run in a process pool
+    :param items: (id, indexed doc source, remembered doc, ordered new events), the base is built from the source
+    if the doc is indexed, otherwise the remembered doc (dropped by sampling) is used if any
+    :return: merged docs in the same order
+    """
+    return [
+        fold(events, base=from_source(_id, source) if source is not None else remembered)
+        for _id, source, remembered, events in items
+    ]
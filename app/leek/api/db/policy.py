@@ -6,7 +6,8 @@ from leek.api.ext import es
 
 # https://www.elastic.co/blog/implementing-hot-warm-cold-in-elasticsearch-with-index-lifecycle-management
 
-def create_or_update_default_lifecycle_policy(
+def create_or_update_lifecycle_policy(
+        policy_name="default",
         hot_max_size=100,
         hot_max_age=10,
         warm_age=5,
@@ -16,6 +17,8 @@ def create_or_update_default_lifecycle_policy(
     """
     The lifecycle policy governs how the index transitions through these stages and
     the actions that are performed on the index at each stage. The policy can specify:
+    :param policy_name: Policy name, applications use the default policy and their environments series may use
+    their own policies.
     :param hot_max_age: The maximum age at which you want to roll over to a new index.
     :param hot_max_size: The maximum size at which you want to roll over to a new index.
     :param warm_age: The point at which the index is no longer being updated and
@@ -104,6 +107,6 @@ def create_or_update_default_lifecycle_policy(
         }
     }
     try:
-        return es.connection.ilm.put_lifecycle("default", body=policy), 200
+        return es.connection.ilm.put_lifecycle(policy_name, body=policy), 200
     except es_exceptions.ConnectionError:
         return responses.cache_backend_unavailable
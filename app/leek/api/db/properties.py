@@ -30,6 +30,9 @@ properties = {
     "events_count": {
         "type": "long"
     },
+    "sample_weight": {
+        "type": "long"
+    },
     # Tasks specific
     "uuid": {
         "type": "keyword",
@@ -190,3 +193,41 @@ properties = {
         "type": "keyword",
     },
 }
+
+# Keywords aggregated by dashboards, their global ordinals are built at refresh instead of on the first aggregation
+AGGREGATED_KEYWORDS = ["name", "state", "queue"]
+# Payloads kept in _source only, they can be read but not searched
+STORED_ONLY = ["args", "kwargs", "result", "traceback"]
+
+
+def lean_properties():
+    lean = {}
+    for name, prop in properties.items():
+        if name in STORED_ONLY:
+            # Payloads are not analyzed, short values can still be matched exactly with the capped keyword
+            lean[name] = {"type": "text", "index": False,
+                          "fields": {"keyword": {"type": "keyword", "ignore_above": 256}}}
+        elif prop["type"] == "keyword":
+            lean[name] = {**prop, "ignore_above": 512}
+            if name in AGGREGATED_KEYWORDS:
+                lean[name]["eager_global_ordinals"] = True
+        else:
+            lean[name] = prop
+    return lean
+
+
+# Mapping profiles applied by applications index templates
+mapping_profiles = {
+    "default": {
+        "properties": properties,
+        "settings": {},
+    },
+    # Faster indexing and smaller store, at the cost of searching payloads (args, kwargs, result, traceback)
+    "lean": {
+        "properties": lean_properties(),
+        "settings": {
+            "index.refresh_interval": "5s",
+            "index.codec": "best_compression",
+        },
+    },
+}
@@ -0,0 +1,105 @@
+from elasticsearch import exceptions as es_exceptions
+
+from leek.api.cache import TTLCache
+from leek.api.conf import settings
+from leek.api.ext import es
+
+# (index alias, doc id) -> concrete backing index holding the doc, per process
+routes = TTLCache(maxsize=settings.LEEK_API_ROUTING_TABLE_SIZE, ttl=settings.LEEK_API_ROUTING_TABLE_TTL_S)
+# index alias -> (write index, number of backing indices, backing indices)
+write_indices = TTLCache(maxsize=1024, ttl=settings.LEEK_API_WRITE_INDEX_TTL_S)
+
+
+def get_backing_indices(index_alias):
+    """
+    Resolve application backing indices, after rollovers the alias points to many indices (-000001, -000002...)
+    and the newest one receives new docs
+    :param index_alias: index alias in the form of orgName-appName
+    :return: write index, number of backing indices and backing indices
+    """
+    cached = write_indices.get(index_alias)
+    if cached is not None:
+        return cached
+    try:
+        indices = es.connection.indices.get_alias(name=index_alias).keys()
+    except es_exceptions.NotFoundError:
+        indices = []
+    return set_backing_indices(index_alias, indices)
+
+
+def set_backing_indices(index_alias, indices):
+    # The application alias also points to the backing indices of its environments series
+    indices = sorted(index for index in indices if index.rsplit("-", 1)[0] == index_alias)
+    backing = (indices[-1], len(indices), indices) if len(indices) else (index_alias, 1, [index_alias])
+    write_indices.set(index_alias, backing)
+    return backing
+
+
+def get_series_alias(index_alias, env):
+    """
+    Alias of the backing indices series of an application environment (orgName-appName.env)
+    """
+    return f"{index_alias}.{env}"
+
+
+def series_alias(index_alias, app, env):
+    """
+    Alias events of an application environment are written to, the environment own series if the application
+    has one, otherwise the application alias shared by all environments
+    """
+    if app is not None and env in app.env_series:
+        return get_series_alias(index_alias, env)
+    return index_alias
+
+
+def search_indices(index_alias, app, env):
+    """
+    Indices searches filtered on an environment target: its series and the shared series backing indices, which
+    still hold the environment docs indexed before its series was enabled, other environments series are skipped.
+    Searches keep their environment filter
+    """
+    if app is None or env not in app.env_series:
+        return index_alias
+    return ",".join([get_series_alias(index_alias, env)] + get_backing_indices(index_alias)[2])
+
+
+def split_series(index_alias, app, events):
+    """
+    Group events by the alias of their environment series
+    :param events: events grouped by id
+    :return: events grouped by id, by series alias
+    """
+    batches = {}
+    for _id, group in events.items():
+        batches.setdefault(series_alias(index_alias, app, group[0].app_env), {})[_id] = group
+    return batches
+
+
+def get_write_index(index_alias):
+    return get_backing_indices(index_alias)[0]
+
+
+def resolve(index_alias, _id):
+    """
+    Concrete index of an existing doc if known, otherwise the write index
+    """
+    return routes.get((index_alias, _id)) or get_write_index(index_alias)
+
+
+def learn(index_alias, _id, index_name):
+    routes.set((index_alias, _id), index_name)
+
+
+def forget(index_alias, _id):
+    routes.pop((index_alias, _id))
+
+
+def forget_application(index_alias):
+    """
+    Forget application locations (including its environments series) after its indices are deleted
+    """
+    def owned(alias):
+        return alias == index_alias or alias.startswith(f"{index_alias}.")
+
+    write_indices.pop_matching(owned)
+    routes.pop_matching(lambda key: owned(key[0]))
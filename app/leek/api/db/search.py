@@ -16,3 +16,6 @@ def search_index(index_alias, query, params):
         return responses.cache_backend_unavailable
     except es_exceptions.NotFoundError:
         return responses.application_not_found
+    except es_exceptions.RequestError:
+        # Filters on fields that are not indexed (lean mapping profile) for example
+        return responses.invalid_search_query
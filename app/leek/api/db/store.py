@@ -1,5 +1,6 @@
 import abc
-from typing import List, Union, Optional
+import re
+from typing import List, Union, Optional, Pattern, Dict
 from dataclasses import dataclass, field
 
 QUEUED = "QUEUED"
@@ -178,6 +179,8 @@ class Task(EV):
     worker: Optional[str] = None
     events: Optional[List[str]] = field(default_factory=lambda: [])
     events_count: Optional[int] = 1
+    # SAMPLING: number of tasks this doc stands for, when the task name is sampled
+    sample_weight: Optional[int] = None
 
     def resolve_conflict(self, coming: "Task"):
         # print(f"DETECTED CONFLICT {self.state} {coming.state} {coming.uuid}")
@@ -261,6 +264,30 @@ class Task(EV):
         return merged
 
 
+class RateMetric:
+    # Failed tasks / completed tasks over the window
+    FAILURE_RATE = "failure_rate"
+    # 1 - completed tasks over the window / completed tasks over the previous window
+    THROUGHPUT_DROP = "throughput_drop"
+
+
+@dataclass()
+class RateRule:
+    metric: str
+    # Alert when the metric exceeds this ratio (0-1)
+    threshold: float
+    # Sliding window in seconds
+    window: int = 300
+    # Regular expression matched against task names, the metric is evaluated per task name
+    task_name: str = ".*"
+    # Windows with less completed tasks are not evaluated
+    min_count: int = 20
+    pattern: Pattern = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.pattern = re.compile(self.task_name)
+
+
 @dataclass()
 class FanoutTrigger:
     id: str
@@ -272,6 +299,95 @@ class FanoutTrigger:
     exclude: str = field(default_factory=lambda: [])
     include: str = field(default_factory=lambda: [])
     runtime_upper_bound: float = 0
+    # Seconds during which matched tasks are grouped in one digest message, 0 to notify each task
+    aggregation_window: float = 0
+    # Rate triggers are evaluated periodically on ingestion counters instead of being matched against each task
+    rate: Optional[RateRule] = None
+    # Exclusions/inclusions combined in one regular expression each
+    exclude_pattern: Optional[Pattern] = field(init=False, repr=False, compare=False)
+    include_pattern: Optional[Pattern] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        if isinstance(self.rate, dict):
+            self.rate = RateRule(**self.rate)
+        self.exclude_pattern = compile_any(self.exclude)
+        self.include_pattern = compile_any(self.include)
+
+    def matches_name(self, name):
+        """
+        Excluded names are skipped, and when inclusions are specified, only included names are matched
+        """
+        name = name or ""
+        if self.exclude_pattern and self.exclude_pattern.match(name):
+            return False
+        if self.include_pattern and not self.include_pattern.match(name):
+            return False
+        return True
+
+
+def compile_any(patterns: List[str]) -> Optional[Pattern]:
+    if not len(patterns):
+        return None
+    return re.compile("|".join(f"(?:{pattern})" for pattern in patterns))
+
+
+class TriggersIndex:
+    """
+    Enabled triggers indexed by env and state, a trigger without envs (or states) is indexed under None
+    and matches any env (or state)
+    """
+
+    def __init__(self, triggers: List[FanoutTrigger]):
+        self._index = {}
+        for trigger in triggers:
+            if not trigger.enabled or trigger.rate:
+                continue
+            for env in trigger.envs or [None]:
+                for state in trigger.states or [None]:
+                    self._index.setdefault(env, {}).setdefault(state, []).append(trigger)
+
+    def __len__(self):
+        return len(self._index)
+
+    def lookup(self, env, state) -> List[FanoutTrigger]:
+        triggers = []
+        for by_state in (self._index.get(env), self._index.get(None)):
+            if by_state:
+                triggers += by_state.get(state, []) + by_state.get(None, [])
+        return triggers
+
+
+@dataclass()
+class SamplingRule:
+    # Regular expression matched against task names
+    task_name: str
+    # Target rate of indexed successful tasks per second and API process
+    target_rate: float
+    # Successful tasks slower than this (seconds) are always indexed
+    slow_runtime: float = 0
+    pattern: Pattern = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.pattern = re.compile(self.task_name)
+
+    def to_dict(self):
+        return {"task_name": self.task_name, "target_rate": self.target_rate, "slow_runtime": self.slow_runtime}
+
+
+@dataclass()
+class IngestionQuota:
+    # Max events and bytes per second and API process, 0 means unlimited
+    events_per_second: float = 0
+    bytes_per_second: float = 0
+    # Share of the ingestion slots when applications compete for them
+    weight: int = 1
+
+    def to_dict(self):
+        return {
+            "events_per_second": self.events_per_second,
+            "bytes_per_second": self.bytes_per_second,
+            "weight": self.weight,
+        }
 
 
 @dataclass()
@@ -282,3 +398,16 @@ class Application:
     created_at: str
     owner: str
     fo_triggers: List[FanoutTrigger] = field(default_factory=lambda: [])
+    sampling_rules: List[SamplingRule] = field(default_factory=lambda: [])
+    quota: Optional[IngestionQuota] = None
+    mapping_profile: str = "default"
+    number_of_shards: int = 1
+    number_of_replicas: int = 0
+    # app env -> series settings, environments written to their own backing indices series
+    env_series: Dict[str, dict] = field(default_factory=lambda: {})
+    triggers_index: TriggersIndex = field(init=False, repr=False, compare=False)
+    rate_triggers: List[FanoutTrigger] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.triggers_index = TriggersIndex(self.fo_triggers)
+        self.rate_triggers = [trigger for trigger in self.fo_triggers if trigger.enabled and trigger.rate]
@@ -1,37 +1,55 @@
 from datetime import timedelta
+import math
 import time
+from typing import Optional
 
 from elasticsearch import exceptions as es_exceptions
 
+from leek.api.cache import TTLCache
+from leek.api.conf import settings
 from leek.api.ext import es
 from leek.api.errors import responses
-from leek.api.db.properties import properties
+from leek.api.db.properties import mapping_profiles
+from leek.api.db import routing
+from leek.api.db.dead_letters import purge_dead_letters
+from leek.api.db.events_log import delete_events_log
+from leek.api.db.store import Application, FanoutTrigger, SamplingRule, IngestionQuota
 
+# Parsed applications metadata by index alias, per process
+apps_cache = TTLCache(maxsize=1024, ttl=settings.LEEK_API_APP_CACHE_TTL_S)
+# Cached in place of missing applications
+_MISSING_APPLICATION = object()
 
-def create_index_template(index_alias, lifecycle_policy_name="default", meta=None):
+
+def get_index_sort_settings():
     """
-    This is considered as an organization project
-    An organization can have multiple applications(templates)
-    Each day events will be sent to a new index orgName-appName-2020-08-24
-    The newly created index will be assigned the template if index name matches index_patterns
-    Each day indexes older than 14 days will be deleted using curator
-    :param lifecycle_policy_name: Index Lifecycle Policy Name
-    :param meta: application level settings
-    :param index_alias: index alias in the form of orgName-appName
+    Sorted indices let searches sorted on the same field (latest tasks) stop early
     """
-    connection = es.connection
-    body = {
+    if not settings.LEEK_API_INDEX_SORT_FIELD:
+        return {}
+    return {
+        "index.sort.field": settings.LEEK_API_INDEX_SORT_FIELD,
+        "index.sort.order": settings.LEEK_API_INDEX_SORT_ORDER,
+    }
+
+
+def build_template(index_alias, lifecycle_policy_name="default", meta=None, mapping_profile="default"):
+    profile = mapping_profiles[mapping_profile]
+    meta = meta or {}
+    return {
         "index_patterns": [
             f"{index_alias}*"
         ],
         "template": {
             "settings": {
                 "index": {
-                    "number_of_shards": "1",
-                    "number_of_replicas": "0",
+                    "number_of_shards": str(meta.get("number_of_shards", 1)),
+                    "number_of_replicas": str(meta.get("number_of_replicas", 0)),
                 },
                 "index.lifecycle.name": lifecycle_policy_name,
-                "index.lifecycle.rollover_alias": f"{index_alias}-rolled"
+                "index.lifecycle.rollover_alias": f"{index_alias}-rolled",
+                **get_index_sort_settings(),
+                **profile["settings"],
             },
             "aliases": {
                 index_alias: {}
@@ -42,12 +60,55 @@ def create_index_template(index_alias, lifecycle_policy_name="default", meta=Non
                 },
                 "_meta": meta,
                 "dynamic": False,
-                "properties": properties
+                "properties": profile["properties"]
             },
         }
     }
+
+
+def build_env_template(index_alias, env, app):
+    """
+    Template of an application environment series, it takes precedence over the application template for the
+    series backing indices, which also join the application alias so application wide searches still cover them
+    """
+    series = routing.get_series_alias(index_alias, env)
+    meta = {
+        "series_of": index_alias,
+        "app_env": env,
+        "number_of_shards": app.get("number_of_shards", 1),
+        "number_of_replicas": app.get("number_of_replicas", 0),
+    }
+    body = build_template(series, app["env_series"][env]["lifecycle_policy_name"], meta,
+                          app.get("mapping_profile", "default"))
+    body["index_patterns"] = [f"{series}-*"]
+    body["priority"] = 1
+    body["template"]["aliases"] = {index_alias: {}, series: {}}
+    return body
+
+
+def put_env_templates(index_alias, app):
+    for env in app.get("env_series", {}).keys():
+        es.connection.indices.put_index_template(name=routing.get_series_alias(index_alias, env),
+                                                 body=build_env_template(index_alias, env, app))
+
+
+def create_index_template(index_alias, lifecycle_policy_name="default", meta=None, mapping_profile="default"):
+    """
+    This is considered as an organization project
+    An organization can have multiple applications(templates)
+    Each day events will be sent to a new index orgName-appName-2020-08-24
+    The newly created index will be assigned the template if index name matches index_patterns
+    Each day indexes older than 14 days will be deleted using curator
+    :param lifecycle_policy_name: Index Lifecycle Policy Name
+    :param meta: application level settings
+    :param index_alias: index alias in the form of orgName-appName
+    :param mapping_profile: mapping profile name (default, lean)
+    """
+    connection = es.connection
+    body = build_template(index_alias, lifecycle_policy_name, meta, mapping_profile)
     try:
         connection.indices.put_index_template(name=index_alias, body=body, create=True)
+        invalidate_app(index_alias)
         # Create first index
         connection.indices.create(f"{index_alias}-000001")
         return meta, 201
@@ -63,7 +124,11 @@ def get_index_templates(template_prefix):
         templates = connection.indices.get_index_template(name=f"{template_prefix}*")
         applications = []
         for template in templates["index_templates"]:
-            applications.append(template["index_template"]["template"]["mappings"]["_meta"])
+            meta = template["index_template"]["template"]["mappings"]["_meta"]
+            # Environments series templates
+            if "series_of" in meta:
+                continue
+            applications.append(meta)
         return applications, 200
     except es_exceptions.ConnectionError:
         return responses.cache_backend_unavailable
@@ -79,6 +144,59 @@ def get_app(index_alias):
     return get_template(index_alias)["template"]["mappings"]["_meta"]
 
 
+def build_application(app) -> Application:
+    app = dict(app)
+    triggers = [FanoutTrigger(**t) for t in app.pop("fo_triggers")]
+    sampling_rules = [SamplingRule(**r) for r in app.pop("sampling_rules", [])]
+    quota = app.pop("quota", None)
+    return Application(**app, fo_triggers=triggers, sampling_rules=sampling_rules,
+                       quota=IngestionQuota(**quota) if quota else None)
+
+
+def get_cached_application(index_alias) -> Optional[Application]:
+    """
+    :raise es_exceptions.NotFoundError: if the application is cached as missing
+    """
+    cached = apps_cache.get(index_alias)
+    if cached is _MISSING_APPLICATION:
+        # A new error each time, raising the same instance would keep growing its traceback
+        raise es_exceptions.NotFoundError(404, "index_template_missing_exception", f"{index_alias} is missing")
+    return cached
+
+
+def cache_application(index_alias, app) -> Application:
+    application = build_application(app)
+    apps_cache.set(index_alias, application)
+    return application
+
+
+def cache_missing_application(index_alias):
+    apps_cache.set(index_alias, _MISSING_APPLICATION, ttl=settings.LEEK_API_APP_CACHE_NEGATIVE_TTL_S)
+
+
+def get_application(index_alias) -> Application:
+    """
+    Get application from the per process cache or from its index template, this avoids a cluster state read
+    on each ingestion request. Missing applications are cached for a shorter time. The cache is invalidated
+    locally when the application is changed, other processes will see the change after the cache TTL
+    :param index_alias: index alias in the form of orgName-appName
+    :raise es_exceptions.NotFoundError: if the application does not exist
+    """
+    cached = get_cached_application(index_alias)
+    if cached is not None:
+        return cached
+    try:
+        app = get_app(index_alias)
+    except es_exceptions.NotFoundError:
+        cache_missing_application(index_alias)
+        raise
+    return cache_application(index_alias, app)
+
+
+def invalidate_app(index_alias):
+    apps_cache.pop(index_alias)
+
+
 def add_or_update_app_fo_trigger(index_alias, trigger):
     """
     Update application metadata stored in index template
@@ -98,6 +216,7 @@ def add_or_update_app_fo_trigger(index_alias, trigger):
             triggers[trigger_index] = trigger
 
         es.connection.indices.put_index_template(name=index_alias, body=template)
+        invalidate_app(index_alias)
         return app, 200
     except es_exceptions.ConnectionError:
         return responses.cache_backend_unavailable
@@ -122,6 +241,27 @@ def delete_app_fo_trigger(index_alias, trigger_id):
             del triggers[trigger_index]
 
         es.connection.indices.put_index_template(name=index_alias, body=template)
+        invalidate_app(index_alias)
+        return app, 200
+    except es_exceptions.ConnectionError:
+        return responses.cache_backend_unavailable
+    except es_exceptions.NotFoundError:
+        return responses.application_not_found
+
+
+def update_app_sampling_rules(index_alias, sampling_rules):
+    """
+    Replace application sampling rules stored in index template metadata
+    :param index_alias: index alias in the form of orgName-appName
+    :param sampling_rules: list of sampling rules
+    """
+    try:
+        template = get_template(index_alias)
+        app = template["template"]["mappings"]["_meta"]
+        app["sampling_rules"] = sampling_rules
+
+        es.connection.indices.put_index_template(name=index_alias, body=template)
+        invalidate_app(index_alias)
         return app, 200
     except es_exceptions.ConnectionError:
         return responses.cache_backend_unavailable
@@ -129,6 +269,180 @@ def delete_app_fo_trigger(index_alias, trigger_id):
         return responses.application_not_found
 
 
+def update_app_quota(index_alias, quota):
+    """
+    Replace application ingestion quota stored in index template metadata
+    :param index_alias: index alias in the form of orgName-appName
+    :param quota: ingestion quota, None to remove it
+    """
+    try:
+        template = get_template(index_alias)
+        app = template["template"]["mappings"]["_meta"]
+        app["quota"] = quota
+
+        es.connection.indices.put_index_template(name=index_alias, body=template)
+        invalidate_app(index_alias)
+        return app, 200
+    except es_exceptions.ConnectionError:
+        return responses.cache_backend_unavailable
+    except es_exceptions.NotFoundError:
+        return responses.application_not_found
+
+
+def update_app_shards(index_alias, number_of_shards, number_of_replicas):
+    """
+    Update application shards and replicas counts. Shards are applied to the next backing index, replicas are
+    also applied to existing indices
+    :param index_alias: index alias in the form of orgName-appName
+    :param number_of_shards: primary shards of each backing index
+    :param number_of_replicas: replicas of each primary shard
+    """
+    connection = es.connection
+    try:
+        template = get_template(index_alias)
+        app = template["template"]["mappings"]["_meta"]
+        app["number_of_shards"] = number_of_shards
+        app["number_of_replicas"] = number_of_replicas
+        index_settings = template["template"]["settings"].setdefault("index", {})
+        index_settings["number_of_shards"] = str(number_of_shards)
+        index_settings["number_of_replicas"] = str(number_of_replicas)
+
+        connection.indices.put_index_template(name=index_alias, body=template)
+        put_env_templates(index_alias, app)
+        connection.indices.put_settings(index=index_alias, body={"index": {"number_of_replicas": number_of_replicas}})
+        invalidate_app(index_alias)
+        return app, 200
+    except es_exceptions.ConnectionError:
+        return responses.cache_backend_unavailable
+    except es_exceptions.NotFoundError:
+        return responses.application_not_found
+
+
+def add_app_env_series(index_alias, env, lifecycle_policy_name="default"):
+    """
+    Write an application environment events to its own backing indices series (orgName-appName.env-00000N),
+    governed by its own lifecycle policy. Docs already indexed in the shared series stay there
+    :param index_alias: index alias in the form of orgName-appName
+    :param env: application environment
+    :param lifecycle_policy_name: lifecycle policy of the series backing indices
+    """
+    connection = es.connection
+    series = routing.get_series_alias(index_alias, env)
+    try:
+        template = get_template(index_alias)
+        app = template["template"]["mappings"]["_meta"]
+        app.setdefault("env_series", {})[env] = {"lifecycle_policy_name": lifecycle_policy_name}
+
+        connection.indices.put_index_template(name=series, body=build_env_template(index_alias, env, app))
+        # First backing index of the series, kept if the series is only updated
+        connection.indices.create(f"{series}-000001", ignore=400)
+        connection.indices.put_index_template(name=index_alias, body=template)
+        routing.write_indices.pop(series)
+        invalidate_app(index_alias)
+        return app, 200
+    except es_exceptions.ConnectionError:
+        return responses.cache_backend_unavailable
+    except es_exceptions.NotFoundError:
+        return responses.application_not_found
+
+
+def delete_app_env_series(index_alias, env):
+    """
+    Write an application environment events back to the shared series, the series indices stay searchable through
+    the application alias until their lifecycle policy deletes them
+    :param index_alias: index alias in the form of orgName-appName
+    :param env: application environment
+    """
+    connection = es.connection
+    try:
+        template = get_template(index_alias)
+        app = template["template"]["mappings"]["_meta"]
+        app.get("env_series", {}).pop(env, None)
+
+        connection.indices.put_index_template(name=index_alias, body=template)
+        connection.indices.delete_index_template(routing.get_series_alias(index_alias, env), ignore=404)
+        invalidate_app(index_alias)
+        return app, 200
+    except es_exceptions.ConnectionError:
+        return responses.cache_backend_unavailable
+    except es_exceptions.NotFoundError:
+        return responses.application_not_found
+
+
+def get_shards_advice(index_alias):
+    """
+    Recommend a primary shards count from the observed indexing rate and size of the application backing indices,
+    so that each shard of the next backing index stays under the per shard indexing rate and size targets
+    :param index_alias: index alias in the form of orgName-appName
+    """
+    connection = es.connection
+    try:
+        stats = connection.indices.stats(index=index_alias, metric="docs,store,indexing")["indices"]
+        index_settings = connection.indices.get_settings(index=index_alias, name="index.creation_date,"
+                                                                                 "index.number_of_shards")
+    except es_exceptions.ConnectionError:
+        return responses.cache_backend_unavailable
+    except es_exceptions.NotFoundError:
+        return responses.application_not_found
+    now_ms = time.time() * 1000
+    indices = []
+    # Environments series are sized by the same settings, the advice is based on the shared series
+    for index_name in sorted(name for name in stats.keys() if name.rsplit("-", 1)[0] == index_alias):
+        primaries = stats[index_name]["primaries"]
+        index = index_settings[index_name]["settings"]["index"]
+        age_s = max(1., (now_ms - int(index["creation_date"])) / 1000)
+        indices.append({
+            "index": index_name,
+            "number_of_shards": int(index["number_of_shards"]),
+            "docs": primaries["docs"]["count"],
+            "size_in_bytes": primaries["store"]["size_in_bytes"],
+            # Updates are counted, as each task is written many times
+            "indexing_rate": round(primaries["indexing"]["index_total"] / age_s, 2),
+        })
+    if not len(indices):
+        return responses.application_not_found
+    # The write index receives the current ingest rate, the largest index tells how big indices grow
+    indexing_rate = indices[-1]["indexing_rate"]
+    max_size = max(index["size_in_bytes"] for index in indices)
+    by_rate = math.ceil(indexing_rate / settings.LEEK_API_SHARD_MAX_INDEXING_RATE)
+    by_size = math.ceil(max_size / (settings.LEEK_API_SHARD_TARGET_SIZE_GB * 1024 ** 3))
+    return {
+               "indices": indices,
+               "current_number_of_shards": indices[-1]["number_of_shards"],
+               "recommended_number_of_shards": min(32, max(1, by_rate, by_size)),
+           }, 200
+
+
+def migrate_application(index_alias):
+    """
+    Apply the current template settings and mappings (index sorting, mapping profile...) to an existing application.
+    Index settings like sorting can not be changed on existing indices, so the template is updated and the next
+    backing index is created, it receives new docs while older docs stay searchable through the alias
+    :param index_alias: index alias in the form of orgName-appName
+    """
+    connection = es.connection
+    try:
+        template = get_template(index_alias)
+        app = template["template"]["mappings"]["_meta"]
+        lifecycle_policy_name = template["template"]["settings"].get("index", {}).get("lifecycle", {}).get("name",
+                                                                                                           "default")
+        body = build_template(index_alias, lifecycle_policy_name, app, app.get("mapping_profile", "default"))
+        connection.indices.put_index_template(name=index_alias, body=body)
+        put_env_templates(index_alias, app)
+        invalidate_app(index_alias)
+        # Next backing index
+        routing.write_indices.pop(index_alias)
+        write_index = routing.get_write_index(index_alias)
+        next_index = f"{index_alias}-{int(write_index.rsplit('-', 1)[1]) + 1:06d}"
+        connection.indices.create(next_index)
+        routing.write_indices.pop(index_alias)
+        return {"write_index": next_index}, 201
+    except es_exceptions.ConnectionError:
+        return responses.cache_backend_unavailable
+    except es_exceptions.NotFoundError:
+        return responses.application_not_found
+
+
 def delete_application(index_alias):
     """
     Delete index template (Application) and all related indexes (Application Data)
@@ -137,8 +451,14 @@ def delete_application(index_alias):
     """
     connection = es.connection
     try:
+        for env in get_app(index_alias).get("env_series", {}).keys():
+            connection.indices.delete_index_template(routing.get_series_alias(index_alias, env), ignore=404)
         connection.indices.delete_index_template(index_alias)
+        invalidate_app(index_alias)
         connection.indices.delete(f"{index_alias}*")
+        routing.forget_application(index_alias)
+        purge_dead_letters(index_alias)
+        delete_events_log(index_alias)
         return "Done", 200
     except es_exceptions.ConnectionError:
         return responses.cache_backend_unavailable
@@ -146,16 +466,28 @@ def delete_application(index_alias):
         return responses.application_already_exist
 
 
+def reset_application_indices(index_alias):
+    """
+    Delete application tasks/workers indices and create the first backing index of each series
+    :param index_alias: application indices prefix AKA Application name
+    """
+    connection = es.connection
+    connection.indices.delete(f"{index_alias}*")
+    connection.indices.create(f"{index_alias}-000001")
+    for env in get_app(index_alias).get("env_series", {}).keys():
+        connection.indices.create(f"{routing.get_series_alias(index_alias, env)}-000001")
+    routing.forget_application(index_alias)
+
+
 def purge_application(index_alias):
     """
     Purge application data by deleting all indexes and create primary empty index
     :param index_alias: application indices prefix AKA Application name
     :return:
     """
-    connection = es.connection
     try:
-        connection.indices.delete(f"{index_alias}*")
-        connection.indices.create(f"{index_alias}-000001")
+        reset_application_indices(index_alias)
+        purge_dead_letters(index_alias)
         return "Done", 200
     except es_exceptions.ConnectionError:
         return responses.cache_backend_unavailable
@@ -5,9 +5,12 @@ from elasticsearch import exceptions as es_exceptions
 from flask import g, request
 from jose import JWTError
 
-from leek.api.db.store import Application, FanoutTrigger
+from leek.api.backpressure import pressure
+from leek.api.idempotency import batches, IN_PROGRESS, not_written
+from leek.api.tenants import quotas, scheduler, retry_after
 from leek.api.errors import responses
-from leek.api.db.template import get_app
+from leek.api.db.template import get_application
+from leek.api.db import routing
 from leek.api.conf import settings
 from leek.api.auth import decode_jwt_token
 
@@ -56,8 +59,8 @@ def auth(_route=None, allowed_org_names: List = None, only_app_owner=False):
                 except KeyError as e:
                     return responses.missing_headers
                 try:
-                    app = get_app(f"{g.org_name}-{app_name}")
-                    if g.email != app.get("owner"):
+                    app = get_application(f"{g.org_name}-{app_name}")
+                    if g.email != app.owner:
                         return responses.insufficient_permission
                 except es_exceptions.NotFoundError:
                     return responses.application_not_found
@@ -73,6 +76,35 @@ def auth(_route=None, allowed_org_names: List = None, only_app_owner=False):
     return decorator
 
 
+def resolve_app_context(org_name, app_name, app_env, app_key):
+    """
+    Get and authenticate the application events are sent to
+    :return: (context, None) or (None, error response)
+    """
+    try:
+        # Get/Build application
+        application = get_application(f"{org_name}-{app_name}")
+        # Authenticate
+        if app_key not in [application.app_key, settings.LEEK_AGENT_API_SECRET]:
+            return None, responses.wrong_application_app_key
+    except es_exceptions.NotFoundError:
+        return None, responses.application_not_found
+    except es_exceptions.ConnectionError:
+        return None, responses.cache_backend_unavailable
+
+    # Build context
+    return {
+        "index_alias": f"{org_name}-{app_name}",
+        # Alias events are written to, the environment series if the application has one
+        "series_alias": routing.series_alias(f"{org_name}-{app_name}", application, app_env),
+        "app": application,
+        "org_name": org_name,
+        "app_name": app_name,
+        "app_env": app_env,
+        "app_key": app_key,
+    }, None
+
+
 def get_app_context(_route=None):
     def decorator(route):
         @wraps(route)
@@ -87,29 +119,11 @@ def get_app_context(_route=None):
                 return responses.missing_headers
 
             # Get app
-            try:
-                # Get/Build application
-                app = get_app(f"{org_name}-{app_name}")
-                fo_triggers = app.pop("fo_triggers")
-                triggers = [FanoutTrigger(**t) for t in fo_triggers]
-                application = Application(**app, fo_triggers=triggers)
-                # Authenticate
-                if app_key not in [application.app_key, settings.LEEK_AGENT_API_SECRET]:
-                    return responses.wrong_application_app_key
-            except es_exceptions.NotFoundError:
-                return responses.application_not_found
-            except es_exceptions.ConnectionError:
-                return responses.cache_backend_unavailable
-
-            # Build context
-            g.context = {
-                "index_alias": f"{org_name}-{app_name}",
-                "app": application,
-                "org_name": org_name,
-                "app_name": app_name,
-                "app_env": app_env,
-                "app_key": app_key,
-            }
+            context, error = resolve_app_context(org_name, app_name, app_env, app_key)
+            if error:
+                return error
+
+            g.context = context
             return route(*args, **kwargs)
 
         return wrapper
@@ -117,3 +131,95 @@ def get_app_context(_route=None):
     if _route:
         return decorator(_route)
     return decorator
+
+
+def with_backpressure(_route=None):
+    """
+    Reject ingestion requests with 429 and a Retry-After hint when the process is overloaded
+    """
+    def decorator(route):
+        @wraps(route)
+        def wrapper(*args, **kwargs):
+            if pressure.load() >= 1:
+                body, status = responses.ingestion_overloaded
+                return body, status, {"Retry-After": str(pressure.retry_after())}
+            pressure.enter()
+            try:
+                return route(*args, **kwargs)
+            finally:
+                pressure.exit()
+
+        return wrapper
+
+    if _route:
+        return decorator(_route)
+    return decorator
+
+
+def with_quota(_route=None):
+    """
+    Apply the application ingestion quota, then wait for a merge slot granted fairly across applications,
+    should be used after get_app_context
+    """
+    def decorator(route):
+        @wraps(route)
+        def wrapper(*args, **kwargs):
+            application = g.context["app"]
+            index_alias = g.context["index_alias"]
+            payload = request.get_json()
+            events = len(payload) if isinstance(payload, list) else 1
+            wait_time = quotas.admit(index_alias, application.quota, events, request.content_length or 0)
+            if wait_time:
+                body, status = responses.tenant_quota_exceeded
+                return body, status, {"Retry-After": str(retry_after(wait_time))}
+            if not scheduler.acquire(index_alias, events, application.quota.weight if application.quota else 1):
+                body, status = responses.ingestion_overloaded
+                return body, status, {"Retry-After": str(pressure.retry_after())}
+            try:
+                return route(*args, **kwargs)
+            finally:
+                scheduler.release()
+
+        return wrapper
+
+    if _route:
+        return decorator(_route)
+    return decorator
+
+
+def idempotent(_route=None):
+    """
+    Acknowledge batches replayed by agents (same x-leek-batch-id header) without applying them again,
+    should be used after get_app_context
+    """
+    def decorator(route):
+        @wraps(route)
+        def wrapper(*args, **kwargs):
+            batch_id = request.headers.get("x-leek-batch-id")
+            if not batch_id:
+                return route(*args, **kwargs)
+            index_alias = g.context["index_alias"]
+            state, g.retry_ids = batches.begin(index_alias, batch_id)
+            if state == IN_PROGRESS:
+                return responses.batch_in_progress
+            elif state:
+                return "Already processed", 200
+            try:
+                result = route(*args, **kwargs)
+            except Exception:
+                batches.abort(index_alias, batch_id)
+                raise
+            failed = not_written(result)
+            if isinstance(result, tuple) and result[1] in (201, 207):
+                batches.commit(index_alias, batch_id)
+            elif failed is not None:
+                batches.partial(index_alias, batch_id, failed)
+            else:
+                batches.abort(index_alias, batch_id)
+            return result
+
+        return wrapper
+
+    if _route:
+        return decorator(_route)
+    return decorator
@@ -37,6 +37,15 @@ insufficient_permission = {
                                   "reason": "You don't have enough permission for this action"
                               }
                           }, 401
+
+invalid_search_query = {
+                           "error": {
+                               "code": "400004",
+                               "message": "Invalid request",
+                               "reason": "Search query is invalid or filters on fields that are not indexed"
+                           }
+                       }, 400
+
 missing_headers = {
                       "error": {
                           "code": "400001",
@@ -45,6 +54,38 @@ missing_headers = {
                       }
                   }, 400
 
+ingestion_overloaded = {
+                           "error": {
+                               "code": "429001",
+                               "message": "Too many requests",
+                               "reason": "Ingestion is overloaded, retry after the Retry-After delay"
+                           }
+                       }, 429
+
+tenant_quota_exceeded = {
+                            "error": {
+                                "code": "429002",
+                                "message": "Too many requests",
+                                "reason": "Application ingestion quota exceeded, retry after the Retry-After delay"
+                            }
+                        }, 429
+
+batch_in_progress = {
+                        "error": {
+                            "code": "409001",
+                            "message": "Batch in progress",
+                            "reason": "A batch with the same id is being processed, retry later"
+                        }
+                    }, 409
+
+route_not_in_pool = {
+                        "error": {
+                            "code": "404002",
+                            "message": "Not found",
+                            "reason": "The ingestion pool only serves agents events routes, use the query pool"
+                        }
+                    }, 404
+
 no_subscriptions_found = {
                              "error": {
                                  "code": "400003",
@@ -76,3 +117,32 @@ subscription_already_exist = {
                                      "reason": "A subscription with the same name already exist"
                                  }
                              }, 412
+
+
+def invalid_payload(reason):
+    """
+    Same body as the Flask schema errors handler, for routes served without Flask (aio server)
+    """
+    return {
+               "error": {
+                   "code": "400002",
+                   "title": "Schema Validation Error",
+                   "message": "One or more incorrect fields",
+                   "reason": reason,
+               }
+           }, 400
+
+
+def events_not_written(failed):
+    """
+    Some docs of the batch were rejected by ES (busy nodes...), the batch should be retried
+    :param failed: ids of docs that were not written, by index alias
+    """
+    return {
+               "error": {
+                   "code": "503003",
+                   "message": "Service temporary unavailable",
+                   "reason": "Some events could not be written, retry the batch"
+               },
+               "failed": failed,
+           }, 503
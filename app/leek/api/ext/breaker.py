@@ -0,0 +1,105 @@
+import math
+import time
+import threading
+from collections import deque
+
+CLOSED = "CLOSED"
+OPEN = "OPEN"
+HALF_OPEN = "HALF_OPEN"
+
+
+class CircuitBreaker:
+    """
+    Per process circuit breaker driven by the error rate (slow calls count as errors) over a sliding window.
+    - CLOSED: calls go through, the breaker opens when the error rate reaches the threshold.
+    - OPEN: calls fail fast until the open duration elapses.
+    - HALF_OPEN: a single probe call goes through, its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, error_rate, min_calls, window_s, slow_call_s, open_s):
+        """
+        :param error_rate: failed calls ratio (0..1) that opens the breaker
+        :param min_calls: minimum calls in the window before the error rate is considered
+        :param window_s: sliding window duration in seconds
+        :param slow_call_s: calls slower than this are considered failed
+        :param open_s: how long the breaker stays open before probing
+        """
+        self.error_rate = error_rate
+        self.min_calls = min_calls
+        self.window_s = window_s
+        self.slow_call_s = slow_call_s
+        self.open_s = open_s
+        self.state = CLOSED
+        self.opened_at = 0.
+        self.probing = False
+        self._calls = deque()
+        self._failures = 0
+        self._lock = threading.Lock()
+
+    def _prune(self, now):
+        while self._calls and self._calls[0][0] < now - self.window_s:
+            _, failed = self._calls.popleft()
+            self._failures -= failed
+
+    def _open(self, now):
+        self.state = OPEN
+        self.opened_at = now
+        self.probing = False
+        print(f"ES circuit breaker opened, failing fast for {self.open_s} seconds")
+
+    def _close(self):
+        self.state = CLOSED
+        self.probing = False
+        self._calls.clear()
+        self._failures = 0
+        print("ES circuit breaker closed")
+
+    def allow(self):
+        """
+        Whether a call can go through
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == OPEN and now >= self.opened_at + self.open_s:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def record(self, failed, latency_s):
+        failed = failed or latency_s >= self.slow_call_s
+        with self._lock:
+            now = time.monotonic()
+            if self.state == HALF_OPEN:
+                if failed:
+                    self._open(now)
+                else:
+                    self._close()
+                return
+            self._calls.append((now, failed))
+            self._failures += failed
+            self._prune(now)
+            if self.state == CLOSED and len(self._calls) >= self.min_calls \
+                    and self._failures / len(self._calls) >= self.error_rate:
+                self._open(now)
+
+    def retry_after(self):
+        """
+        Seconds until the breaker probes the backend again
+        """
+        remaining = self.opened_at + self.open_s - time.monotonic()
+        return max(1, math.ceil(remaining))
+
+    def stats(self):
+        with self._lock:
+            self._prune(time.monotonic())
+            calls = len(self._calls)
+            return {
+                "state": self.state,
+                "calls": calls,
+                "error_rate": round(self._failures / calls, 2) if calls else 0,
+                "retry_after": self.retry_after() if self.state != CLOSED else 0,
+            }
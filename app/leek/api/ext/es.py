@@ -1,15 +1,84 @@
+import time
+
 import boto3
-from elasticsearch import Elasticsearch, RequestsHttpConnection
+from elasticsearch import Elasticsearch, RequestsHttpConnection, Urllib3HttpConnection
+from elasticsearch import exceptions as es_exceptions
+from elasticsearch.serializer import JSONSerializer
 
+from leek.api import codec
 from leek.api.conf import settings
 
 from leek.api.ext.base import BaseExtension
+from leek.api.ext.breaker import CircuitBreaker, CLOSED
+
+breaker = CircuitBreaker(
+    error_rate=settings.LEEK_ES_BREAKER_ERROR_RATE,
+    min_calls=settings.LEEK_ES_BREAKER_MIN_CALLS,
+    window_s=settings.LEEK_ES_BREAKER_WINDOW_S,
+    slow_call_s=settings.LEEK_ES_BREAKER_SLOW_CALL_MS / 1000,
+    open_s=settings.LEEK_ES_BREAKER_OPEN_S,
+)
+
+
+class FastJSONSerializer(JSONSerializer):
+
+    def dumps(self, data):
+        # Bulk actions are already serialized
+        if isinstance(data, str):
+            return data
+        try:
+            return codec.dumps(data)
+        except (ValueError, TypeError):
+            return super().dumps(data)
+
+    def loads(self, s):
+        return codec.loads(s)
+
+
+class BreakerConnection(Urllib3HttpConnection):
+    """
+    Fail fast with a ConnectionError while the circuit breaker is open, instead of waiting for timeouts
+    """
+
+    def perform_request(self, *args, **kwargs):
+        if not breaker.allow():
+            raise es_exceptions.ConnectionError("N/A", "Circuit breaker is open", None)
+        start_time = time.monotonic()
+        failed = True
+        try:
+            response = super().perform_request(*args, **kwargs)
+            failed = False
+            return response
+        except es_exceptions.TransportError as e:
+            # Client errors (not found, conflicts...) are not backend failures
+            failed = not isinstance(e.status_code, int) or e.status_code >= 500 or e.status_code == 429
+            raise
+        finally:
+            breaker.record(failed, time.monotonic() - start_time)
 
 
 class ESExtension(BaseExtension):
     connection = None
+    breaker = breaker
 
     def init_app(self, app):
         app.extensions["es"] = self
-        self.connection = Elasticsearch(settings.LEEK_ES_URL)
+        self.connect()
+        app.after_request(self.add_retry_hint)
+
+    def connect(self):
+        """
+        Build the client from settings, also used by processes without Flask app (aio server)
+        """
+        self.connection = Elasticsearch(
+            settings.LEEK_ES_URL,
+            serializer=FastJSONSerializer(),
+            connection_class=BreakerConnection,
+            timeout=settings.LEEK_ES_TIMEOUT_S,
+        )
         print("Connected to elastic search")
+
+    def add_retry_hint(self, response):
+        if response.status_code == 503 and self.breaker.state != CLOSED:
+            response.headers["Retry-After"] = str(self.breaker.retry_after())
+        return response
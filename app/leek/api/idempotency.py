@@ -0,0 +1,190 @@
+import threading
+import time
+
+from elasticsearch import exceptions as es_exceptions
+
+from leek.api.cache import TTLCache
+from leek.api.conf import settings
+from leek.api.ext import es
+
+IN_PROGRESS = "IN_PROGRESS"
+APPLIED = "APPLIED"
+PARTIAL = "PARTIAL"
+
+BATCHES_INDEX = "ingestion_batches"
+
+mappings = {
+    "dynamic": False,
+    "properties": {
+        # Only set on partially applied batches
+        "state": {
+            "type": "keyword",
+        },
+        # Epoch milliseconds of the batch reservation
+        "reserved_at": {
+            "type": "long",
+        },
+        # Epoch milliseconds after which the batch id is forgotten
+        "expires_at": {
+            "type": "long",
+        },
+        # Ids of docs that were not written by a partially applied batch
+        "retry_ids": {
+            "type": "keyword",
+            "index": False,
+        },
+    }
+}
+
+
+class IdempotencyWindow:
+    """
+    Window of recently seen batch ids, shared by all API processes (gunicorn workers, ingestion pool, aio server).
+    A batch replayed by an agent (after a timeout for example) is acknowledged without being merged again,
+    so events_count and events history are not corrupted by retries.
+    Each batch id is reserved by creating a doc (create op type), so only one process applies it, and the doc is
+    only written again if the batch fails. A reservation older than in_progress_ttl seconds is considered applied,
+    batches left in progress by a crashed process are not applied again. Batch ids are forgotten after ttl seconds.
+    Batches partially applied (some docs rejected by ES) remember the ids of docs that were not written, their
+    replays only apply events of these docs.
+    Applied batch ids are also kept in a bounded per process window, replays reaching the same process are
+    acknowledged without ES round trip.
+    """
+
+    def __init__(self, maxsize, ttl, in_progress_ttl):
+        self.ttl = ttl
+        self.in_progress_ttl = in_progress_ttl
+        self._applied = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._index_created = False
+        self._cleaned_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _ensure_index(self):
+        if self._index_created:
+            return
+        try:
+            es.connection.indices.create(BATCHES_INDEX, body={"mappings": mappings})
+        except es_exceptions.RequestError as e:
+            if e.error != "resource_already_exists_exception":
+                raise
+        self._index_created = True
+
+    def _cleanup(self):
+        """
+        Delete expired batch ids, at most once per ttl and process
+        """
+        with self._lock:
+            if time.monotonic() - self._cleaned_at < self.ttl:
+                return
+            self._cleaned_at = time.monotonic()
+        es.connection.delete_by_query(
+            index=BATCHES_INDEX,
+            body={"query": {"range": {"expires_at": {"lt": int(time.time() * 1000)}}}},
+            params=dict(wait_for_completion="false", conflicts="proceed"),
+        )
+
+    def _doc(self, state=None, retry_ids=None):
+        now = int(time.time() * 1000)
+        doc = {"reserved_at": now, "expires_at": now + self.ttl * 1000}
+        if state:
+            doc["state"] = state
+        if retry_ids is not None:
+            doc["retry_ids"] = retry_ids
+        return doc
+
+    def begin(self, index_alias, batch_id):
+        """
+        Reserve a batch id
+        :return: (state, retry ids), state is None if the batch should be applied, otherwise IN_PROGRESS|APPLIED.
+        Retry ids are the ids of docs that were not written by a partially applied batch, None to apply all events
+        """
+        _id = f"{index_alias}:{batch_id}"
+        if _id in self._applied:
+            return APPLIED, None
+        try:
+            return self._begin(_id)
+        except es_exceptions.TransportError as e:
+            # The batch is applied without idempotency, its merge will likely fail too
+            print(f"Unable to reserve batch id: {e}")
+            return None, None
+
+    def _begin(self, _id):
+        self._ensure_index()
+        self._cleanup()
+        try:
+            es.connection.create(index=BATCHES_INDEX, id=_id, body=self._doc())
+            return None, None
+        except es_exceptions.ConflictError:
+            pass
+        try:
+            seen = es.connection.get(index=BATCHES_INDEX, id=_id)
+        except es_exceptions.NotFoundError:
+            # Aborted meanwhile
+            return IN_PROGRESS, None
+        source = seen["_source"]
+        now = time.time() * 1000
+        retry_ids = None
+        if source.get("state") == PARTIAL:
+            retry_ids = source.get("retry_ids")
+        elif source["expires_at"] > now:
+            if now - source["reserved_at"] < self.in_progress_ttl * 1000:
+                return IN_PROGRESS, None
+            return APPLIED, None
+        # Partially applied or expired (not deleted yet)
+        try:
+            es.connection.index(index=BATCHES_INDEX, id=_id, body=self._doc(),
+                                if_seq_no=seen["_seq_no"], if_primary_term=seen["_primary_term"])
+            return None, retry_ids
+        except es_exceptions.ConflictError:
+            # Reserved by another process
+            return IN_PROGRESS, None
+
+    def commit(self, index_alias, batch_id):
+        """
+        The reservation is kept as is, it is considered applied once older than in_progress_ttl
+        """
+        self._applied.set(f"{index_alias}:{batch_id}", APPLIED)
+
+    def partial(self, index_alias, batch_id, retry_ids):
+        """
+        Remember ids of docs that were not written, written docs are not merged again when the batch is replayed
+        """
+        try:
+            es.connection.index(index=BATCHES_INDEX, id=f"{index_alias}:{batch_id}",
+                                body=self._doc(PARTIAL, retry_ids))
+        except es_exceptions.TransportError as e:
+            # The reservation is kept, replays are acknowledged as applied once it is older than in_progress_ttl
+            print(f"Unable to record partially applied batch: {e}")
+
+    def abort(self, index_alias, batch_id):
+        try:
+            es.connection.delete(index=BATCHES_INDEX, id=f"{index_alias}:{batch_id}", ignore=404)
+        except es_exceptions.TransportError as e:
+            print(f"Unable to abort batch id: {e}")
+
+
+def select_retried(events, retry_ids):
+    """
+    Keep events of docs that were not written by the previous attempt of a partially applied batch
+    :param events: new events grouped by id
+    """
+    if retry_ids is None:
+        return events
+    retry_ids = set(retry_ids)
+    return {_id: group for _id, group in events.items() if _id in retry_ids}
+
+
+def not_written(result):
+    """
+    :return: ids of docs that were not written by a route result, None if the result is not a partial failure
+    """
+    if isinstance(result, tuple) and result[1] == 503 and isinstance(result[0], dict) and "failed" in result[0]:
+        return [_id for ids in result[0]["failed"].values() for _id in ids]
+    return None
+
+
+batches = IdempotencyWindow(
+    maxsize=settings.LEEK_API_IDEMPOTENCY_WINDOW_SIZE,
+    ttl=settings.LEEK_API_IDEMPOTENCY_WINDOW_TTL_S,
+    in_progress_ttl=settings.LEEK_API_IDEMPOTENCY_IN_PROGRESS_TTL_S,
+)
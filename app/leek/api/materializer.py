@@ -0,0 +1,124 @@
+import argparse
+import time
+from itertools import groupby
+
+from elasticsearch import exceptions as es_exceptions
+from flask import Flask
+
+from leek.api.channels.pipeline import notify
+from leek.api.conf import settings
+from leek.api.db import events_log
+from leek.api.db import routing
+from leek.api.db.events import merge_many
+from leek.api.db.merge import group_events, from_source
+from leek.api.db.template import get_application, reset_application_indices
+from leek.api.ext import es
+
+"""
+Fold applications events logs into tasks/workers docs, incrementally and in large batches.
+Only used when the API appends raw events to logs (LEEK_API_EVENTS_LOG=true).
+"""
+
+PRUNE_INTERVAL_S = 3600
+
+
+def materialize(index_alias, batch_size, notify_events=True):
+    """
+    Fold the next batch of logged events into tasks/workers docs using the same merge logic as the
+    synchronous ingestion, then move the application checkpoint
+    :param notify_events: notify triggers (fanout and rate) of the merged docs, disabled when replaying history
+    :return: number of materialized events
+    """
+    after = events_log.get_checkpoint(index_alias)
+    raw_events, cursor = events_log.read_events(
+        index_alias, after=after, size=batch_size, lag_s=settings.LEEK_MATERIALIZER_LAG_S
+    )
+    if not len(raw_events):
+        return 0
+    app = get_application(index_alias)
+    events = group_events(from_source(e.pop("id"), e) for e in raw_events)
+    # Environments having their own series are written to it
+    batches = routing.split_series(index_alias, app, events)
+    merged, status = merge_many(batches, {series: app for series in batches.keys()})
+    if status != 201:
+        raise RuntimeError(f"Unable to materialize {index_alias} events: {merged}")
+    merged, failed = merged
+    if len(failed):
+        # The checkpoint is not moved, the whole batch is materialized again
+        raise RuntimeError(f"Unable to materialize {index_alias} events, docs not written: {failed}")
+    result = [doc for docs in merged.values() for doc in docs]
+    if notify_events:
+        for env, docs in groupby(sorted(result, key=lambda d: d.app_env), key=lambda d: d.app_env):
+            notify(index_alias, app, env, list(docs), events)
+    events_log.save_checkpoint(index_alias, cursor)
+    return len(raw_events)
+
+
+def prune():
+    """
+    Delete materialized events older than the events log retention, if any
+    """
+    if not settings.LEEK_MATERIALIZER_RETENTION_H:
+        return
+    for index_alias in events_log.list_logged_applications():
+        after = events_log.get_checkpoint(index_alias)
+        if after:
+            events_log.prune_events_log(index_alias, after, settings.LEEK_MATERIALIZER_RETENTION_H)
+
+
+def run():
+    print("Materializer started")
+    pruned_at = 0
+    while True:
+        if time.monotonic() - pruned_at > PRUNE_INTERVAL_S:
+            try:
+                prune()
+            except es_exceptions.TransportError as e:
+                print(e)
+            pruned_at = time.monotonic()
+        caught_up = True
+        for index_alias in events_log.list_logged_applications():
+            try:
+                count = materialize(index_alias, settings.LEEK_MATERIALIZER_BATCH_SIZE)
+                caught_up = caught_up and count < settings.LEEK_MATERIALIZER_BATCH_SIZE
+            except es_exceptions.NotFoundError:
+                # Application deleted
+                continue
+            except (es_exceptions.TransportError, RuntimeError) as e:
+                print(e)
+        # Keep going without waiting while catching up
+        if caught_up:
+            time.sleep(settings.LEEK_MATERIALIZER_INTERVAL_S)
+
+
+def rebuild(index_alias):
+    """
+    Rebuild all tasks/workers docs of an application from its events log, after a merge logic change for example.
+    The materializer service should be stopped during the rebuild. Triggers are not notified again and dead letters
+    are kept. Applications whose events log was pruned are not rebuilt, their docs older than the retention would be
+    lost.
+    """
+    if events_log.is_pruned(index_alias):
+        print(f"Unable to rebuild {index_alias}: its events log was pruned (LEEK_MATERIALIZER_RETENTION_H)")
+        return
+    print(f"Rebuilding {index_alias} from events log...")
+    reset_application_indices(index_alias)
+    events_log.reset_checkpoint(index_alias)
+    total = 0
+    while True:
+        count = materialize(index_alias, settings.LEEK_MATERIALIZER_REBUILD_BATCH_SIZE, notify_events=False)
+        total += count
+        if count < settings.LEEK_MATERIALIZER_REBUILD_BATCH_SIZE:
+            break
+    print(f"Rebuilt {index_alias} from {total} events")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Leek events log materializer")
+    parser.add_argument("--rebuild", metavar="INDEX_ALIAS", help="Rebuild application docs (orgName-appName)")
+    args = parser.parse_args()
+    es.init_app(Flask(__name__))
+    if args.rebuild:
+        rebuild(args.rebuild)
+    else:
+        run()
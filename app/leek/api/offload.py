@@ -0,0 +1,54 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from leek.api.conf import settings
+
+"""
+CPU heavy work of big batches (validation, merge) is offloaded to a sidecar process pool, so it does not block
+the other requests of the API worker (dashboard searches...).
+Offloading is opt-in (LEEK_API_OFFLOAD_BATCH_SIZE), it was only tried with sync workers and the aio server, waiting
+for the result from a gevent worker relies on gevent patching the threading primitives used by concurrent futures.
+"""
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        # Spawn fresh interpreters instead of forking a gevent patched process
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.LEEK_API_OFFLOAD_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+def reset_executor(broken):
+    """
+    A pool whose child crashed is unusable, it is replaced by a new pool on next use
+    """
+    global _executor
+    if _executor is broken:
+        print("Offload process pool is broken, recreating it")
+        _executor = None
+        broken.shutdown(wait=False)
+
+
+def should_offload(size):
+    return 0 < settings.LEEK_API_OFFLOAD_BATCH_SIZE <= size
+
+
+def run(fn, *args, size=0):
+    """
+    Run fn in the process pool if the batch size is above the offload threshold, otherwise inline.
+    If the pool is broken, fn is run inline
+    """
+    if should_offload(size):
+        executor = get_executor()
+        try:
+            return executor.submit(fn, *args).result()
+        except BrokenProcessPool:
+            reset_executor(executor)
+    return fn(*args)
@@ -1,6 +1,7 @@
-from flask import Blueprint
+from flask import Blueprint, make_response
 from flask_restx import Api
 
+from leek.api import codec
 from leek.api.errors.errors_handler import handle_errors
 
 api_v1_blueprint = Blueprint('api', __name__, url_prefix=f'/v1')
@@ -12,4 +13,11 @@ api_v1 = Api(api_v1_blueprint,
              doc='/docs')
 
 
+@api_v1.representation("application/json")
+def output_json(data, code, headers=None):
+    response = make_response(codec.dumps(data) + "\n", code)
+    response.headers.extend(headers or {})
+    return response
+
+
 handle_errors(api_v1)
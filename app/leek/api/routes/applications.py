@@ -5,12 +5,15 @@ from string import ascii_uppercase
 
 from flask import Blueprint, request, g
 from flask_restx import Resource
-from schema import SchemaError
+from schema import Schema, SchemaError
 
 from leek.api.decorators import auth
 from leek.api.utils import generate_app_key, init_trigger
-from leek.api.schemas.application import ApplicationSchema, TriggerSchema
+from leek.api.schemas.application import ApplicationSchema, TriggerSchema, SamplingRuleSchema, QuotaSchema, \
+    ShardsSchema, EnvSeriesSchema, EnvNameSchema
+from leek.api.schemas.search_params import SearchParamsSchema
 from leek.api.db import template as apps
+from leek.api.db import dead_letters
 from leek.api.routes.api_v1 import api_v1
 
 applications_bp = Blueprint('applications', __name__, url_prefix='/v1/applications')
@@ -39,7 +42,8 @@ class Applications(Resource):
         return apps.create_index_template(
             index_alias=template_name,
             lifecycle_policy_name="default",
-            meta=app
+            meta=app,
+            mapping_profile=app["mapping_profile"]
         )
 
     @auth
@@ -126,6 +130,112 @@ class ApplicationIndices(Resource):
         return apps.get_application_indices(f"{g.org_name}-{app_name}")
 
 
+@applications_ns.route('/<string:app_name>/sampling-rules')
+class ApplicationSamplingRules(Resource):
+
+    @auth(only_app_owner=True)
+    def put(self, app_name):
+        """
+        Replace application sampling rules
+        """
+        data = request.get_json()
+        sampling_rules = Schema([SamplingRuleSchema]).validate(data)
+        return apps.update_app_sampling_rules(
+            index_alias=f"{g.org_name}-{app_name}",
+            sampling_rules=sampling_rules
+        )
+
+
+@applications_ns.route('/<string:app_name>/shards')
+class ApplicationShards(Resource):
+
+    @auth
+    def get(self, app_name):
+        """
+        Recommend application shards count from its indices indexing rate and size
+        """
+        return apps.get_shards_advice(f"{g.org_name}-{app_name}")
+
+    @auth(only_app_owner=True)
+    def put(self, app_name):
+        """
+        Update application shards (applied at the next backing index) and replicas counts
+        """
+        data = ShardsSchema.validate(request.get_json())
+        return apps.update_app_shards(f"{g.org_name}-{app_name}", data["number_of_shards"],
+                                      data["number_of_replicas"])
+
+
+@applications_ns.route('/<string:app_name>/envs/<string:app_env>')
+class ApplicationEnvSeries(Resource):
+
+    @auth(only_app_owner=True)
+    def put(self, app_name, app_env):
+        """
+        Write application environment events to its own backing indices series
+        """
+        EnvNameSchema.validate(app_env)
+        data = EnvSeriesSchema.validate(request.get_json() or {})
+        return apps.add_app_env_series(f"{g.org_name}-{app_name}", app_env, data["lifecycle_policy_name"])
+
+    @auth(only_app_owner=True)
+    def delete(self, app_name, app_env):
+        """
+        Write application environment events back to the shared backing indices series
+        """
+        return apps.delete_app_env_series(f"{g.org_name}-{app_name}", app_env)
+
+
+@applications_ns.route('/<string:app_name>/migrate')
+class MigrateApplication(Resource):
+
+    @auth(only_app_owner=True)
+    def post(self, app_name):
+        """
+        Apply current index template settings to the application, from its next backing index
+        """
+        return apps.migrate_application(f"{g.org_name}-{app_name}")
+
+
+@applications_ns.route('/<string:app_name>/quota')
+class ApplicationQuota(Resource):
+
+    @auth(only_app_owner=True)
+    def put(self, app_name):
+        """
+        Replace application ingestion quota
+        """
+        quota = QuotaSchema.validate(request.get_json())
+        return apps.update_app_quota(index_alias=f"{g.org_name}-{app_name}", quota=quota)
+
+    @auth(only_app_owner=True)
+    def delete(self, app_name):
+        """
+        Remove application ingestion quota
+        """
+        return apps.update_app_quota(index_alias=f"{g.org_name}-{app_name}", quota=None)
+
+
+@applications_ns.route('/<string:app_name>/dead-letters')
+class ApplicationDeadLetters(Resource):
+
+    @auth
+    def get(self, app_name):
+        """
+        List application rejected events
+        """
+        params = SearchParamsSchema.validate(request.args.to_dict())
+        return dead_letters.get_dead_letters(f"{g.org_name}-{app_name}", size=params["size"] or 100,
+                                             from_=params["from_"])
+
+    @auth(only_app_owner=True)
+    def delete(self, app_name):
+        """
+        Purge application rejected events
+        """
+        return dead_letters.purge_dead_letters(f"{g.org_name}-{app_name}")
+
+
 @applications_ns.route('/<string:app_name>/fo-triggers/<string:trigger_id>')
 class UpdateFanoutTriggers(Resource):
 
@@ -3,12 +3,21 @@ import time
 
 from flask import Blueprint, request, g
 from flask_restx import Resource
+from schema import SchemaError
 
 from leek.api.channels.pipeline import notify
-from leek.api.decorators import get_app_context
-from leek.api.db.events import merge_events
-from leek.api.schemas.serializer import validate_payload
+from leek.api.decorators import get_app_context, with_backpressure, idempotent, with_quota, resolve_app_context
+from leek.api.db.events import merge_events, merge_many
+from leek.api.db.dead_letters import store_dead_letters
+from leek.api.db.events_log import append_events, append_many
+from leek.api.conf import settings
+from leek.api import offload
+from leek.api.db.merge import merge_groups
+from leek.api.idempotency import batches as idempotency_window, IN_PROGRESS, select_retried
+from leek.api.tenants import quotas, retry_after
+from leek.api.schemas.serializer import validate_payload, MultiAppPayloadSchema
 from leek.api.routes.api_v1 import api_v1
+from leek.api.errors import responses
 
 events_bp = Blueprint('events', __name__, url_prefix='/v1/events')
 events_ns = api_v1.namespace('events', 'Agents events handler')
@@ -19,7 +28,10 @@ logger = logging.getLogger(__name__)
 @events_ns.route('/process')
 class ProcessEvents(Resource):
 
+    @with_backpressure
     @get_app_context
+    @idempotent
+    @with_quota
     def post(self):
         """
         Process agent events
@@ -28,12 +40,132 @@ class ProcessEvents(Resource):
         start_time = time.time()
         payload = request.get_json()
         env = g.context["app_env"]
+        if not isinstance(payload, (list, dict)):
+            raise SchemaError("Payload does not have events")
         if not len(payload):
             return "Nothing to be processed", 200
-        events = validate_payload(payload, env)
-        result, status = merge_events(g.context["index_alias"], events)
-        # print("--- Store %s seconds ---" % (time.time() - start_time))
-        if status == 201:
-            notify(g.context["app"], env, result)
-            return "Processed", status
-        return result, status
+        events, rejected = offload.run(validate_payload, payload, env, size=len(payload) if isinstance(payload, list) else 1)
+        # Replays of partially applied batches only apply events of docs that were not written
+        events = select_retried(events, g.get("retry_ids"))
+        if len(events) and settings.LEEK_API_EVENTS_LOG:
+            # Events are folded into tasks/workers docs and notified later by the materializer
+            result, status = append_events(g.context["index_alias"], events)
+            if status != 201:
+                return result, status
+        elif len(events):
+            merged, status = merge_events(g.context["series_alias"], events, app=g.context["app"])
+            # print("--- Store %s seconds ---" % (time.time() - start_time))
+            if status != 201:
+                return merged, status
+            result, failed = merged
+            notify(g.context["index_alias"], g.context["app"], env, result, events)
+            if len(failed):
+                # Written docs are remembered by the batch id, its replay only applies the failed ones
+                return responses.events_not_written({g.context["series_alias"]: failed})
+        if len(rejected):
+            # Quarantine rejected events, agents should not retry them
+            store_dead_letters(g.context["index_alias"], env, rejected)
+            return {
+                       "accepted": sum(len(group) for group in events.values()),
+                       "rejected": [{"index": r["index"], "reason": r["reason"]} for r in rejected],
+                   }, 207
+        return "Processed", 201
+
+
+@events_ns.route('/process-many')
+class ProcessManyEvents(Resource):
+
+    @with_backpressure
+    def post(self):
+        """
+        Process agent events of many applications at once.
+        Applications quotas are applied per entry, entries are not scheduled as they are written in one bulk
+        """
+        payload = MultiAppPayloadSchema.validate(request.get_json())
+        total_events = sum(len(e["events"]) if isinstance(e["events"], list) else 1 for e in payload) or 1
+        batch_id = request.headers.get("x-leek-batch-id")
+        results = []
+        accepted = []
+        batches = {}
+        apps = {}
+        for position, entry in enumerate(payload):
+            env = entry["app_env"]
+            result = {"org_name": entry["org_name"], "app_name": entry["app_name"], "app_env": env}
+            results.append(result)
+            # Authenticate and resolve application once per (org, app, env)
+            context, error = resolve_app_context(entry["org_name"], entry["app_name"], env, entry["app_key"])
+            if error:
+                result.update({"status": error[1], **error[0]})
+                continue
+            index_alias = context["index_alias"]
+            # Skip replayed entries, entries of the same application and environment are reserved separately
+            idempotency_key = None
+            retry_ids = None
+            if batch_id:
+                idempotency_key = f"{batch_id}:{position}"
+                state, retry_ids = idempotency_window.begin(index_alias, idempotency_key)
+                if state:
+                    body, status = responses.batch_in_progress if state == IN_PROGRESS else ("Already processed", 200)
+                    result.update({"status": status, "message": body})
+                    continue
+            size = len(entry["events"]) if isinstance(entry["events"], list) else 1
+            # Entry bytes are estimated from its share of the request events
+            wait_time = quotas.admit(index_alias, context["app"].quota, size,
+                                     (request.content_length or 0) * size // total_events)
+            if wait_time:
+                if batch_id:
+                    idempotency_window.abort(index_alias, idempotency_key)
+                body, status = responses.tenant_quota_exceeded
+                result.update({"status": status, "retry_after": retry_after(wait_time), **body})
+                continue
+            events, rejected = offload.run(validate_payload, entry["events"], env, size=size)
+            events = select_retried(events, retry_ids)
+            # Events log is per application, docs are written to the environment series
+            batch_key = index_alias if settings.LEEK_API_EVENTS_LOG else context["series_alias"]
+            merge_groups(batches.setdefault(batch_key, {}), events)
+            apps[batch_key] = context["app"]
+            result.update({
+                "status": 207 if len(rejected) else 201,
+                "accepted": sum(len(group) for group in events.values()),
+                "rejected": [{"index": r["index"], "reason": r["reason"]} for r in rejected],
+            })
+            accepted.append((context, result, list(events.keys()), rejected, idempotency_key))
+
+        # Write all applications events in one multi index bulk
+        failed = {}
+        if settings.LEEK_API_EVENTS_LOG:
+            merged, status = append_many(batches)
+        else:
+            merged, status = merge_many(batches, apps)
+            if status == 201:
+                merged, failed = merged
+        notified = set()
+        for context, result, ids, rejected, idempotency_key in accepted:
+            index_alias = context["index_alias"]
+            if status != 201:
+                if batch_id:
+                    idempotency_window.abort(index_alias, idempotency_key)
+                continue
+            env = context["app_env"]
+            if not settings.LEEK_API_EVENTS_LOG and (context["series_alias"], env) not in notified:
+                # Merged docs are notified once, even if many entries have the same application and environment
+                notified.add((context["series_alias"], env))
+                series_alias = context["series_alias"]
+                notify(index_alias, context["app"], env, [e for e in merged[series_alias] if e.app_env == env],
+                       batches[series_alias])
+            series_failed = set(failed.get(context["series_alias"], []))
+            entry_failed = [_id for _id in ids if _id in series_failed]
+            if len(entry_failed):
+                # Written docs are remembered by the batch id, the entry replay only applies the failed ones
+                if batch_id:
+                    idempotency_window.partial(index_alias, idempotency_key, entry_failed)
+                body, status_code = responses.events_not_written({context["series_alias"]: entry_failed})
+                result.update({"status": status_code, **body})
+                continue
+            if len(rejected):
+                store_dead_letters(index_alias, env, rejected)
+            if batch_id:
+                idempotency_window.commit(index_alias, idempotency_key)
+        if status != 201:
+            return merged, status
+        return {"results": results}, 201 if all(r["status"] == 201 for r in results) else 207
@@ -1,13 +1,20 @@
 import logging
 
-from flask import Blueprint, current_app, url_for
+from flask import Blueprint, current_app, url_for, request
 from flask_restx import Resource
 
+from leek.api.backpressure import pressure
+from leek.api.channels.aggregator import aggregator
+from leek.api.channels.dispatcher import dispatcher
+from leek.api.db.bulk import writer
+from leek.api.ext import es
 from leek.api.utils import has_no_empty_params
 from leek.api.conf import settings
-from leek.api.db.policy import create_or_update_default_lifecycle_policy
+from leek.api.db.policy import create_or_update_lifecycle_policy
 from leek.api.routes.api_v1 import api_v1
+from leek.api.schemas.lifecycle import LifecycleSchema
 from leek.api.decorators import auth
+from leek.api.tenants import quotas, scheduler
 
 manage_bp = Blueprint('manage', __name__, url_prefix='/v1/manage')
 manage_ns = api_v1.namespace('manage', 'Operations related to management.')
@@ -26,7 +33,13 @@ class HealthCheck(Resource):
         """
         Useful to prevent cold start, should be called periodically by another lambda
         """
-        return {"status": "I'm sexy and i know it"}, 200
+        return {
+                   "status": "I'm sexy and i know it",
+                   "ingestion": pressure.stats(),
+                   "bulk": writer.stats(),
+                   "notifications": {**dispatcher.stats(), "digests": aggregator.stats()},
+                   "es": es.breaker.stats(),
+               }, 200
 
 
 @manage_ns.route('/site-map')
@@ -47,6 +60,17 @@ class ListSiteMap(Resource):
         return {"links": links}, 200
 
 
+@manage_ns.route('/usage')
+class IngestionUsage(Resource):
+
+    @auth(allowed_org_names=[settings.LEEK_API_OWNER_ORG])
+    def get(self):
+        """
+        Get applications ingestion usage counters and fair scheduling state of this API process, to size quotas
+        """
+        return {"applications": quotas.usage(), "scheduler": scheduler.stats()}, 200
+
+
 @manage_ns.route('/lifecycle')
 class IndexLifecycle(Resource):
 
@@ -55,4 +79,16 @@ class IndexLifecycle(Resource):
         """
         Update default index lifecycle
         """
-        return create_or_update_default_lifecycle_policy()
+        return create_or_update_lifecycle_policy()
+
+
+@manage_ns.route('/lifecycle/<string:policy_name>')
+class NamedIndexLifecycle(Resource):
+
+    @auth(allowed_org_names=[settings.LEEK_API_OWNER_ORG])
+    def put(self, policy_name):
+        """
+        Create or update a named index lifecycle, used by applications environments series
+        """
+        data = LifecycleSchema.validate(request.get_json())
+        return create_or_update_lifecycle_policy(policy_name, **data)
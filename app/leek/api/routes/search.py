@@ -1,11 +1,15 @@
 import logging
 
+from elasticsearch import exceptions as es_exceptions
 from flask import Blueprint, request, g
 from flask_restx import Resource
 
 from leek.api.decorators import auth
 from leek.api.schemas.search_params import SearchParamsSchema
 from leek.api.db.search import search_index
+from leek.api.db.template import get_application
+from leek.api.db import routing
+from leek.api.errors import responses
 from leek.api.routes.api_v1 import api_v1
 
 search_bp = Blueprint('search', __name__, url_prefix='/v1/search')
@@ -27,4 +31,12 @@ class Search(Resource):
         index_alias = f"{org_name}-{app_name}"
         query = request.get_json()
         params = SearchParamsSchema.validate(request.args.to_dict())
+        app_env = params.pop("app_env", None)
+        if app_env:
+            try:
+                index_alias = routing.search_indices(index_alias, get_application(index_alias), app_env)
+            except es_exceptions.NotFoundError:
+                return responses.application_not_found
+            except es_exceptions.ConnectionError:
+                return responses.cache_backend_unavailable
         return search_index(index_alias, query, params)
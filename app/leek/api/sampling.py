@@ -0,0 +1,80 @@
+import math
+import time
+import threading
+import zlib
+from typing import List, Optional, Union
+
+from leek.api.cache import TTLCache
+from leek.api.conf import settings
+from leek.api.db.store import Task, Worker, SamplingRule, EventKind, STATES_SUCCESS, STATES_EXCEPTION
+
+
+class AdaptiveSampler:
+    """
+    Per process sampling of high volume task names, evaluated at ingestion.
+    - Failures, retries and slow runs are always kept.
+    - Other tasks are kept 1-in-N, N is adjusted to the rule target rate of successful tasks.
+
+    The decision is made on a hash of the task uuid and N is a power of two, so all events of a task
+    get the same decision while N is stable, and tasks kept with 2N are also kept with N.
+    Dropped docs are remembered for a while, so a later failure of a dropped task is indexed with
+    everything known about it (name, args...).
+    """
+    ADJUST_INTERVAL_S = 10
+
+    def __init__(self, remember_size, remember_ttl):
+        # (index alias, rule) -> [window start, successes count, N]
+        self._rates = {}
+        self._lock = threading.Lock()
+        self._dropped = TTLCache(maxsize=remember_size, ttl=remember_ttl)
+
+    def get_n(self, index_alias, rule: SamplingRule, observed=0):
+        key = (index_alias, rule.task_name)
+        now = time.monotonic()
+        with self._lock:
+            rate = self._rates.setdefault(key, [now, 0, 1])
+            rate[1] += observed
+            elapsed = now - rate[0]
+            if elapsed >= self.ADJUST_INTERVAL_S:
+                ratio = rate[1] / elapsed / rule.target_rate
+                rate[2] = 1 << max(0, math.ceil(math.log2(ratio))) if ratio > 1 else 1
+                rate[0], rate[1] = now, 0
+            return rate[2]
+
+    @staticmethod
+    def get_rule(rules: List[SamplingRule], doc: Union[Task, Worker]) -> Optional[SamplingRule]:
+        if doc.kind != EventKind.TASK or not doc.name:
+            return None
+        return next((rule for rule in rules if rule.pattern.match(doc.name)), None)
+
+    def sample(self, index_alias, rules: List[SamplingRule], doc: Union[Task, Worker]) -> Optional[int]:
+        """
+        :return: None if the doc is not subject to sampling, 0 if it should be dropped,
+        otherwise the number of tasks it stands for
+        """
+        rule = self.get_rule(rules, doc)
+        if rule is None:
+            return None
+        # Keep all failures and retries
+        if doc.state in STATES_EXCEPTION or doc.retries:
+            return 1
+        succeeded = doc.state in STATES_SUCCESS
+        # Keep slow runs
+        if succeeded and rule.slow_runtime and (doc.runtime or 0) >= rule.slow_runtime:
+            return 1
+        n = self.get_n(index_alias, rule, observed=1 if succeeded else 0)
+        if zlib.crc32(doc.uuid.encode("utf-8")) % n == 0:
+            return n
+        return 0
+
+    def remember(self, index_alias, doc: Union[Task, Worker]):
+        self._dropped.set((index_alias, doc.id), doc)
+
+    def recall(self, index_alias, _id) -> Optional[Union[Task, Worker]]:
+        return self._dropped.pop((index_alias, _id))
+
+
+sampler = AdaptiveSampler(
+    remember_size=settings.LEEK_API_SAMPLING_REMEMBER_SIZE,
+    remember_ttl=settings.LEEK_API_SAMPLING_REMEMBER_TTL_S,
+)
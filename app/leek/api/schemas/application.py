@@ -1,21 +1,62 @@
-from schema import Schema, And, Or, Optional, Use
+import re
+
+from schema import Schema, And, Or, Optional, Use, Regex
 
 states = ["QUEUED", "RECEIVED", "STARTED", "SUCCEEDED", "RETRY", "REVOKED", "FAILED", "REJECTED"]
 
+RateRuleSchema = Schema({
+    "metric": Or("failure_rate", "throughput_drop"),
+    "threshold": And(Use(float), lambda n: 0 < n < 1),
+    Optional("window", default=300): And(Use(int), lambda n: 60 <= n <= 1800),
+    Optional("task_name", default=".*"): And(str, len, Use(lambda p: re.compile(p) and p)),
+    Optional("min_count", default=20): And(Use(int), lambda n: 1 <= n),
+})
+
 TriggerSchema = Schema({
     "enabled": And(bool),
     Optional("states", default=[]): [str],
     Optional("envs", default=[]): [str],
     Optional("runtime_upper_bound"): And(Use(float), lambda n: 0.000000000001 <= n <= 1000),
-    Optional(Or("exclude", "include", only_one=True)): [str],
+    Optional("aggregation_window"): And(Use(float), lambda n: 0 <= n <= 3600),
+    Optional("rate"): RateRuleSchema,
+    Optional(Or("exclude", "include", only_one=True)): [And(str, len, Use(lambda p: re.compile(p) and p))],
     "type": Or("slack"),
     "slack_wh_url": And(str, len),
 })
 
+SamplingRuleSchema = Schema({
+    "task_name": And(str, len, Use(lambda p: re.compile(p) and p)),
+    "target_rate": And(Use(float), lambda n: 0 < n <= 100000),
+    Optional("slow_runtime", default=0): And(Use(float), lambda n: 0 <= n <= 100000),
+})
+
+QuotaSchema = Schema({
+    Optional("events_per_second", default=0): And(Use(float), lambda n: 0 <= n <= 1000000),
+    Optional("bytes_per_second", default=0): And(Use(int), lambda n: 0 <= n),
+    Optional("weight", default=1): And(Use(int), lambda n: 1 <= n <= 100),
+})
+
+ShardsSchema = Schema({
+    "number_of_shards": And(Use(int), lambda n: 1 <= n <= 32),
+    Optional("number_of_replicas", default=0): And(Use(int), lambda n: 0 <= n <= 5),
+})
+
+EnvSeriesSchema = Schema({
+    Optional("lifecycle_policy_name", default="default"): And(str, len),
+})
+
+# Environments are part of their series indices names
+EnvNameSchema = Schema(Regex(r"^[a-z0-9_]+$"))
+
 ApplicationSchema = Schema(
     {
         "app_name": And(str, len),
         "app_description": And(str, len),
-        Optional("fo_triggers", default=[]): []
+        Optional("fo_triggers", default=[]): [],
+        Optional("sampling_rules", default=[]): [SamplingRuleSchema],
+        Optional("quota"): QuotaSchema,
+        Optional("mapping_profile", default="default"): Or("default", "lean"),
+        Optional("number_of_shards", default=1): And(Use(int), lambda n: 1 <= n <= 32),
+        Optional("number_of_replicas", default=0): And(Use(int), lambda n: 0 <= n <= 5),
     }
 )
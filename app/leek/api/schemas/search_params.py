@@ -1,8 +1,15 @@
-from schema import Schema, And, Optional, Use
+from schema import Schema, And, Or, Optional, Use
 
 SearchParamsSchema = Schema(
     {
         Optional("size", default=0): And(Use(int), lambda n: 0 <= n <= 100000),
         Optional("from_", default=0): And(Use(int), lambda n: 0 <= n <= 100000),
+        # Hits are counted accurately up to this bound (or not at all with false), sorted indices stop early
+        Optional("track_total_hits"): Or(
+            And(Or("true", "false"), Use(lambda v: v == "true")),
+            And(Use(int), lambda n: 0 <= n <= 100000),
+        ),
+        # Searches filtered on one environment only target its series, if the application has one
+        Optional("app_env"): And(str, len),
     }
 )
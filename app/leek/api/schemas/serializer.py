@@ -1,11 +1,25 @@
-from typing import Tuple, Union, Dict
+from typing import Tuple, Union, Dict, List
 
-from schema import Schema, SchemaError
+from schema import Schema, SchemaError, And, Or
 
 from leek.api.db.store import Task, Worker
+from leek.api.db.merge import group_events
 from leek.api.schemas.task import TASK_EVENT_TYPES, TASK_STATE_MAPPING, TaskEventSchema
 from leek.api.schemas.worker import WORKER_EVENT_TYPES, WORKER_STATE_MAPPING, WorkerEventSchema
 
+# Events of many applications sent in one request
+MultiAppPayloadSchema = Schema(
+    [
+        {
+            "org_name": And(str, len),
+            "app_name": And(str, len),
+            "app_env": And(str, len),
+            "app_key": And(str, len),
+            "events": Or(list, dict),
+        }
+    ]
+)
+
 HISTORICAL_TS_NAMES = {
     "task-sent": "queued_at",
     "task-received": "received_at",
@@ -47,21 +61,30 @@ def get_custom_fields(kind, ev_type, event):
     }
 
 
-def validate_payload(payload, app_env) -> Dict[str, Union[Task, Worker]]:
-    # Payload contain many events at once
-    if isinstance(payload, list):
-        validated_payload = {}
-        for event in payload:
-            validated_payload.update(validate_event(event, app_env))
-        return validated_payload
+def validate_payload(payload, app_env) -> Tuple[Dict[str, List[Union[Task, Worker]]], List[dict]]:
+    """
+    Validate a batch of events, malformed events are rejected one by one instead of failing the whole batch
+    :return: valid events grouped by id, and rejected events with their position in the batch and reason
+    """
     # Payload is just one event
-    elif isinstance(payload, dict):
-        return validate_event(payload, app_env)
-    else:
+    if isinstance(payload, dict):
+        payload = [payload]
+    # Payload contain many events at once
+    if not isinstance(payload, list):
         raise SchemaError("Payload does not have events")
+    events = []
+    rejected = []
+    for index, event in enumerate(payload):
+        try:
+            events.append(validate_event(event, app_env))
+        except SchemaError as e:
+            rejected.append({"index": index, "reason": str(e), "event": event})
+    return group_events(events), rejected
 
 
-def validate_event(ev, app_env) -> Dict[str, Union[Task, Worker]]:
+def validate_event(ev, app_env) -> Union[Task, Worker]:
+    if not isinstance(ev, dict):
+        raise SchemaError("Event should be an object")
     ev_type = ev.get("type")
     kind, schema = get_schema(ev_type)
     event = schema.validate(ev)
@@ -73,7 +96,6 @@ def validate_event(ev, app_env) -> Dict[str, Union[Task, Worker]]:
         # Adapt hostname
         origin = "client" if event["state"] == "QUEUED" else "worker"
         event[origin] = event.pop("hostname")
-        event_obj = Task(id=event["uuid"], **event,)
+        return Task(id=event["uuid"], **event,)
     else:
-        event_obj = Worker(id=event["hostname"],  **event,)
-    return {event_obj.id: event_obj}
+        return Worker(id=event["hostname"],  **event,)
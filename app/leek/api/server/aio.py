@@ -0,0 +1,329 @@
+import asyncio
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+from aiohttp import web
+from elasticsearch import AsyncElasticsearch, AIOHttpConnection
+from elasticsearch import exceptions as es_exceptions
+from elasticsearch.helpers import async_streaming_bulk
+from schema import SchemaError
+
+from leek.api import codec, offload
+from leek.api.backpressure import pressure
+from leek.api.channels.pipeline import notify
+from leek.api.conf import settings
+from leek.api.db import events, routing, template
+from leek.api.db.bulk import writer, log_failures
+from leek.api.db.dead_letters import store_dead_letters
+from leek.api.db.events_log import append_events
+from leek.api.db.merge import fold_many
+from leek.api.errors import responses
+from leek.api.ext import es
+from leek.api.ext.breaker import CLOSED
+from leek.api.ext.es import FastJSONSerializer, breaker
+from leek.api.idempotency import batches, IN_PROGRESS, select_retried, not_written
+from leek.api.schemas.serializer import validate_payload
+from leek.api.tenants import quotas, retry_after
+
+"""
+Optional asyncio ingestion server, serving /v1/events/process only next to the gunicorn API.
+A single event loop multiplexes agents connections and ES round trips, while validation and merge use the
+same serializer and merge modules as the Flask route, and the same per process caches (applications,
+routing, idempotency, backpressure, quotas). Merges are not fair scheduled, the event loop does not block on
+slots. Blocking side work (dead letters, events log) runs in the default thread pool and CPU heavy work of big
+batches in the offload process pool.
+"""
+
+routes = web.RouteTableDef()
+
+
+class BreakerAIOHttpConnection(AIOHttpConnection):
+    """
+    Fail fast with a ConnectionError while the circuit breaker is open, same as the synchronous connection
+    """
+
+    async def perform_request(self, *args, **kwargs):
+        if not breaker.allow():
+            raise es_exceptions.ConnectionError("N/A", "Circuit breaker is open", None)
+        start_time = time.monotonic()
+        failed = True
+        try:
+            response = await super().perform_request(*args, **kwargs)
+            failed = False
+            return response
+        except es_exceptions.TransportError as e:
+            failed = not isinstance(e.status_code, int) or e.status_code >= 500 or e.status_code == 429
+            raise
+        finally:
+            breaker.record(failed, time.monotonic() - start_time)
+
+
+def json_response(result, headers=None):
+    if len(result) > 2:
+        headers = {**(headers or {}), **result[2]}
+    return web.json_response(result[0], status=result[1], headers=headers, dumps=codec.dumps)
+
+
+async def run_offloaded(fn, *args, size=0):
+    """
+    Run fn in the process pool if the batch size is above the offload threshold, otherwise inline
+    """
+    if offload.should_offload(size):
+        executor = offload.get_executor()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+        except BrokenProcessPool:
+            offload.reset_executor(executor)
+    return fn(*args)
+
+
+async def run_in_thread(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+
+async def get_application(connection: AsyncElasticsearch, index_alias):
+    """
+    Same as template.get_application, using the async client on cache misses
+    :raise es_exceptions.NotFoundError: if the application does not exist
+    """
+    cached = template.get_cached_application(index_alias)
+    if cached is not None:
+        return cached
+    try:
+        templates = await connection.indices.get_index_template(name=index_alias)
+    except es_exceptions.NotFoundError:
+        template.cache_missing_application(index_alias)
+        raise
+    return template.cache_application(
+        index_alias, templates["index_templates"][0]["index_template"]["template"]["mappings"]["_meta"]
+    )
+
+
+async def resolve_app_context(connection: AsyncElasticsearch, headers):
+    """
+    :return: (context, None) or (None, error response)
+    """
+    try:
+        org_name = headers["x-leek-org-name"]
+        app_name = headers["x-leek-app-name"]
+        app_env = headers["x-leek-app-env"]
+        app_key = headers["x-leek-app-key"]
+    except KeyError:
+        return None, responses.missing_headers
+    index_alias = f"{org_name}-{app_name}"
+    try:
+        application = await get_application(connection, index_alias)
+        if app_key not in [application.app_key, settings.LEEK_AGENT_API_SECRET]:
+            return None, responses.wrong_application_app_key
+    except es_exceptions.NotFoundError:
+        return None, responses.application_not_found
+    except es_exceptions.ConnectionError:
+        return None, responses.cache_backend_unavailable
+    return {
+               "index_alias": index_alias,
+               "series_alias": routing.series_alias(index_alias, application, app_env),
+               "app": application,
+               "app_env": app_env,
+           }, None
+
+
+async def load_backing_indices(connection: AsyncElasticsearch, index_alias):
+    """
+    Resolve the application write index with the async client, so the routing module only reads its cache
+    """
+    if routing.write_indices.get(index_alias) is not None:
+        return
+    try:
+        indices = (await connection.indices.get_alias(name=index_alias)).keys()
+    except es_exceptions.NotFoundError:
+        indices = []
+    routing.set_backing_indices(index_alias, indices)
+
+
+async def retrieve_indexed(connection: AsyncElasticsearch, new_events):
+    aliases, docs = events.locate(new_events)
+    if not len(docs):
+        return []
+    indexed = (await connection.mget(body={"docs": docs}))["docs"]
+    found = {}
+    for index_alias, ids in events.collect_misses(aliases, indexed).items():
+        try:
+            hits = (await connection.search(
+                index=index_alias,
+                body={"query": {"ids": {"values": ids}}},
+                size=len(ids),
+            ))["hits"]["hits"]
+        except es_exceptions.NotFoundError:
+            raise events.RetrieveIndexedError("Index not found")
+        found[index_alias] = {hit["_id"]: {**hit, "found": True} for hit in hits}
+    return events.learn_locations(aliases, indexed, found)
+
+
+async def write(connection: AsyncElasticsearch, actions):
+    """
+    Same as bulk.writer.write, chunks are written serially
+    """
+    actions, size = writer.serialize(actions)
+    start_time = time.monotonic()
+    results = [r async for r in async_streaming_bulk(connection, actions, **writer.options())]
+    writer.record(size, time.monotonic() - start_time)
+    log_failures(results)
+    return results
+
+
+async def merge_events(connection: AsyncElasticsearch, index_alias, new_events, app):
+    """
+    Same as events.merge_events, with non blocking ES round trips
+    """
+    new_batches = {index_alias: new_events}
+    start_time = time.monotonic()
+    try:
+        await load_backing_indices(connection, index_alias)
+        keys, items = events.prepare_fold(new_batches, await retrieve_indexed(connection, new_batches))
+        docs = await run_offloaded(fold_many, items, size=sum(len(item[3]) for item in items))
+        safe_events, dropped = events.apply_sampling(new_batches, keys, docs, {index_alias: app})
+        keys, actions = events.build_bulk(safe_events, dropped)
+        updated = {index_alias: []}
+        failed = {}
+        if len(actions):
+            results = await write(connection, actions)
+            failed = events.collect_updated(updated, safe_events, keys, results)
+        return (updated[index_alias], failed.get(index_alias, [])), 201
+    except es_exceptions.ConnectionError:
+        return responses.cache_backend_unavailable
+    except es_exceptions.RequestError as e:
+        print(codec.dumps(e.info))
+        return "Request error", 409
+    except events.RetrieveIndexedError:
+        return responses.application_not_found
+    finally:
+        pressure.record_latency(time.monotonic() - start_time)
+
+
+async def process(request: web.Request, context, retry_ids=None):
+    try:
+        payload = await request.json(loads=codec.loads)
+    except ValueError as e:
+        return responses.invalid_payload(f"Payload is not valid JSON: {e}")
+    env = context["app_env"]
+    index_alias = context["index_alias"]
+    if not isinstance(payload, (list, dict)):
+        return responses.invalid_payload("Payload does not have events")
+    if not len(payload):
+        return "Nothing to be processed", 200
+    wait_time = quotas.admit(index_alias, context["app"].quota, len(payload) if isinstance(payload, list) else 1,
+                             request.content_length or 0)
+    if wait_time:
+        body, status = responses.tenant_quota_exceeded
+        return body, status, {"Retry-After": str(retry_after(wait_time))}
+    try:
+        new_events, rejected = await run_offloaded(
+            validate_payload, payload, env, size=len(payload) if isinstance(payload, list) else 1
+        )
+    except SchemaError as e:
+        return responses.invalid_payload(str(e))
+    # Replays of partially applied batches only apply events of docs that were not written
+    new_events = select_retried(new_events, retry_ids)
+    if len(new_events) and settings.LEEK_API_EVENTS_LOG:
+        # Events are folded into tasks/workers docs and notified later by the materializer
+        result, status = await run_in_thread(append_events, index_alias, new_events)
+        if status != 201:
+            return result, status
+    elif len(new_events):
+        merged, status = await merge_events(request.app["es"], context["series_alias"], new_events, context["app"])
+        if status != 201:
+            return merged, status
+        result, failed = merged
+        # Notifications are only enqueued, they are delivered by the background dispatcher
+        notify(index_alias, context["app"], env, result, new_events)
+        if len(failed):
+            # Written docs are remembered by the batch id, its replay only applies the failed ones
+            return responses.events_not_written({context["series_alias"]: failed})
+    if len(rejected):
+        # Quarantine rejected events, agents should not retry them
+        await run_in_thread(store_dead_letters, index_alias, env, rejected)
+        return {
+                   "accepted": sum(len(group) for group in new_events.values()),
+                   "rejected": [{"index": r["index"], "reason": r["reason"]} for r in rejected],
+               }, 207
+    return "Processed", 201
+
+
+@routes.post("/v1/events/process")
+async def process_events(request: web.Request):
+    """
+    Process agent events, same contract as the Flask route (backpressure, app context, idempotency)
+    """
+    if pressure.load() >= 1:
+        return json_response(responses.ingestion_overloaded, headers={"Retry-After": str(pressure.retry_after())})
+    pressure.enter()
+    try:
+        context, error = await resolve_app_context(request.app["es"], request.headers)
+        if error:
+            return json_response(error)
+        batch_id = request.headers.get("x-leek-batch-id")
+        if not batch_id:
+            return json_response(await process(request, context))
+        index_alias = context["index_alias"]
+        state, retry_ids = await run_in_thread(batches.begin, index_alias, batch_id)
+        if state == IN_PROGRESS:
+            return json_response(responses.batch_in_progress)
+        elif state:
+            return json_response(("Already processed", 200))
+        try:
+            result = await process(request, context, retry_ids)
+        except Exception:
+            await run_in_thread(batches.abort, index_alias, batch_id)
+            raise
+        failed = not_written(result)
+        if result[1] in (201, 207):
+            await run_in_thread(batches.commit, index_alias, batch_id)
+        elif failed is not None:
+            await run_in_thread(batches.partial, index_alias, batch_id, failed)
+        else:
+            await run_in_thread(batches.abort, index_alias, batch_id)
+        return json_response(result)
+    finally:
+        pressure.exit()
+
+
+@routes.options("/v1/events/process")
+async def process_events_options(request: web.Request):
+    # Used by bootstrap and agents to check the API is up
+    return web.Response(status=200, headers={"Allow": "OPTIONS, POST"})
+
+
+@web.middleware
+async def add_retry_hint(request, handler):
+    response = await handler(request)
+    if response.status == 503 and breaker.state != CLOSED:
+        response.headers["Retry-After"] = str(breaker.retry_after())
+    return response
+
+
+async def on_startup(app):
+    app["es"] = AsyncElasticsearch(
+        settings.LEEK_ES_URL,
+        serializer=FastJSONSerializer(),
+        connection_class=BreakerAIOHttpConnection,
+        timeout=settings.LEEK_ES_TIMEOUT_S,
+    )
+    print("Connected to elastic search (async)")
+
+
+async def on_cleanup(app):
+    await app["es"].close()
+
+
+def create_app():
+    # Synchronous client used by side work running in threads (dead letters, events log)
+    es.connect()
+    app = web.Application(middlewares=[add_retry_hint])
+    app.add_routes(routes)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+if __name__ == '__main__':
+    web.run_app(create_app(), host="0.0.0.0", port=settings.LEEK_API_AIO_PORT)
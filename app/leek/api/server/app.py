@@ -1,15 +1,42 @@
 from __future__ import print_function
 
-from flask import Flask
+from flask import Flask, request
+from flask.json import JSONDecoder
 
+from leek.api import codec
+from leek.api.auth import prefetch_public_keys
+from leek.api.conf import settings
+from leek.api.errors import responses
 from leek.api.extensions import init_extensions
 from leek.api.blueprints import register_blueprints
 
 
+# Routes served by the ingestion pool
+INGESTION_PATHS = ("/v1/events/", "/v1/manage/hc")
+
+
+class FastJSONDecoder(JSONDecoder):
+
+    def decode(self, s, *args, **kwargs):
+        return codec.loads(s)
+
+
+def restrict_to_ingestion():
+    """
+    Agents events are the only routes served by the ingestion pool, others are served by the query pool
+    """
+    if not request.path.startswith(INGESTION_PATHS):
+        return responses.route_not_in_pool
+
+
 def create_app():
     app = Flask(__name__)
+    app.json_decoder = FastJSONDecoder
     init_extensions(app)
     app.url_map.strict_slashes = False
     app.config['JSONIFY_PRETTYPRINT_REGULAR'] = True
     register_blueprints(app)
+    if settings.LEEK_API_POOL == "ingestion":
+        app.before_request(restrict_to_ingestion)
+    prefetch_public_keys()
     return app
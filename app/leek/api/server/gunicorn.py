@@ -1,5 +1,31 @@
 import os
 
+#
+# Pools
+#
+#   The API can run as two process groups, so dashboard queries and
+#   events ingestion do not delay each other:
+#
+#   query - All routes, used by the web app (and agents when the
+#       ingestion pool is disabled).
+#
+#   ingestion - Agents events routes only, enabled with
+#       LEEK_API_INGESTION_POOL=true.
+#
+#   Each pool is sized with LEEK_API_<POOL>_* env variables.
+#
+
+pool = os.environ.get('LEEK_API_POOL', 'query').upper()
+pool_defaults = {
+    'QUERY': {'PORT': 5000, 'WORKERS': 2, 'WORKER_CONNECTIONS': 1000, 'TIMEOUT': 120},
+    'INGESTION': {'PORT': 5002, 'WORKERS': 2, 'WORKER_CONNECTIONS': 200, 'TIMEOUT': 60},
+}[pool]
+
+
+def get_pool_int(name):
+    return int(os.environ.get(f'LEEK_API_{pool}_{name}', pool_defaults[name]))
+
+
 #
 # Server socket
 #
@@ -18,7 +44,7 @@ import os
 #       range.
 #
 
-bind = '0.0.0.0:5000'
+bind = f"0.0.0.0:{get_pool_int('PORT')}"
 backlog = 2048
 
 #
@@ -65,10 +91,10 @@ backlog = 2048
 #       A positive integer. Generally set in the 1-5 seconds range.
 #
 
-workers = 2
+workers = get_pool_int('WORKERS')
 worker_class = 'gevent'
-worker_connections = 1000
-timeout = 120
+worker_connections = get_pool_int('WORKER_CONNECTIONS')
+timeout = get_pool_int('TIMEOUT')
 keepalive = 60
 
 #
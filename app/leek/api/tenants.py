@@ -0,0 +1,174 @@
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+from leek.api.conf import settings
+from leek.api.db.store import IngestionQuota
+
+
+class TokenBucket:
+    """
+    Token bucket allowing debt, a batch bigger than the bucket capacity is admitted when the bucket is not empty
+    and the following batches wait until the debt is paid back
+    """
+
+    def __init__(self, rate, burst_s):
+        self.rate = rate
+        self.capacity = rate * burst_s
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self):
+        self.refill()
+        return 0 if self.tokens > 0 else -self.tokens / self.rate + 1 / self.rate
+
+    def consume(self, n):
+        self.tokens -= n
+
+
+class TenantQuotas:
+    """
+    Per process ingestion quotas of applications (events/s and bytes/s) and usage counters
+    """
+
+    def __init__(self, burst_s):
+        self.burst_s = burst_s
+        # (index alias, unit) -> TokenBucket
+        self._buckets = {}
+        # index alias -> usage counters
+        self._usage = {}
+        self._lock = threading.Lock()
+
+    def _get_bucket(self, index_alias, unit, rate):
+        bucket = self._buckets.get((index_alias, unit))
+        # Quota changed
+        if bucket is None or bucket.rate != rate:
+            bucket = self._buckets[(index_alias, unit)] = TokenBucket(rate, self.burst_s)
+        return bucket
+
+    def admit(self, index_alias, quota: Optional[IngestionQuota], events, size):
+        """
+        :return: 0 if the batch is admitted, otherwise seconds to wait before retrying
+        """
+        with self._lock:
+            usage = self._usage.setdefault(
+                index_alias, {"requests": 0, "events": 0, "bytes": 0, "throttled_requests": 0}
+            )
+            buckets = []
+            if quota and quota.events_per_second:
+                buckets.append((self._get_bucket(index_alias, "events", quota.events_per_second), events))
+            if quota and quota.bytes_per_second:
+                buckets.append((self._get_bucket(index_alias, "bytes", quota.bytes_per_second), size))
+            wait_time = max([bucket.wait_time() for bucket, _ in buckets], default=0)
+            if wait_time:
+                usage["throttled_requests"] += 1
+                return wait_time
+            for bucket, n in buckets:
+                bucket.consume(n)
+            usage["requests"] += 1
+            usage["events"] += events
+            usage["bytes"] += size
+            return 0
+
+    def usage(self):
+        with self._lock:
+            return {index_alias: dict(usage) for index_alias, usage in self._usage.items()}
+
+
+class FairScheduler:
+    """
+    Per process weighted fair scheduling of ingestion batches.
+    A limited number of batches are merged concurrently, when all slots are busy, waiting batches are queued by
+    application and granted with deficit round robin: each round, an application earns quantum x weight events
+    of credit and its queued batches are granted while their events count fits in its credit. So a flooding
+    application does not delay the others more than its share.
+    """
+
+    def __init__(self, slots, quantum, max_wait_s):
+        self.slots = slots
+        self.quantum = quantum
+        self.max_wait_s = max_wait_s
+        self._free = slots
+        # index alias -> queued tickets, in round robin order
+        self._queues = OrderedDict()
+        self._deficits = {}
+        self._cond = threading.Condition()
+
+    def acquire(self, index_alias, cost, weight=1):
+        """
+        Wait for a merge slot
+        :return: False if no slot was granted after max_wait_s
+        """
+        if not self.slots:
+            return True
+        with self._cond:
+            if self._free and not self._queues:
+                self._free -= 1
+                return True
+            ticket = {"cost": cost, "weight": weight, "granted": False}
+            self._queues.setdefault(index_alias, deque()).append(ticket)
+            self._cond.wait_for(lambda: ticket["granted"], timeout=self.max_wait_s)
+            if not ticket["granted"]:
+                self._cancel(index_alias, ticket)
+            return ticket["granted"]
+
+    def release(self):
+        if not self.slots:
+            return
+        with self._cond:
+            self._free += 1
+            self._dispatch()
+            self._cond.notify_all()
+
+    def _cancel(self, index_alias, ticket):
+        queue = self._queues.get(index_alias)
+        queue.remove(ticket)
+        if not queue:
+            del self._queues[index_alias]
+            self._deficits.pop(index_alias, None)
+
+    def _dispatch(self):
+        while self._free and self._queues:
+            index_alias, queue = next(iter(self._queues.items()))
+            ticket = queue[0]
+            deficit = self._deficits.get(index_alias, 0) + self.quantum * ticket["weight"]
+            # Grant as many batches of this application as its credit allows
+            while queue and queue[0]["cost"] <= deficit and self._free:
+                ticket = queue.popleft()
+                deficit -= ticket["cost"]
+                ticket["granted"] = True
+                self._free -= 1
+            if not queue:
+                del self._queues[index_alias]
+                self._deficits.pop(index_alias, None)
+            else:
+                # Next application
+                self._deficits[index_alias] = deficit
+                self._queues.move_to_end(index_alias)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "busy_slots": self.slots - self._free,
+                "queued": {index_alias: len(queue) for index_alias, queue in self._queues.items()},
+            }
+
+
+def retry_after(wait_time):
+    return min(settings.LEEK_API_INGESTION_MAX_RETRY_AFTER_S, max(1, math.ceil(wait_time)))
+
+
+quotas = TenantQuotas(burst_s=settings.LEEK_API_QUOTA_BURST_S)
+
+scheduler = FairScheduler(
+    slots=settings.LEEK_API_FAIR_SLOTS,
+    quantum=settings.LEEK_API_FAIR_QUANTUM,
+    max_wait_s=settings.LEEK_API_FAIR_MAX_WAIT_S,
+)
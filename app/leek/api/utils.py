@@ -21,7 +21,8 @@ def init_trigger(tr, app_name):
                f"- *states*: {trigger.states}\n" \
                f"- *exclude*: {trigger.exclude}\n" \
                f"- *include*: {trigger.include}\n" \
-               f"- *runtime upper bound*: {trigger.runtime_upper_bound} seconds"
+               f"- *runtime upper bound*: {trigger.runtime_upper_bound} seconds\n" \
+               f"- *aggregation window*: {trigger.aggregation_window} seconds"
         try:
             response = requests.post(
                 url=trigger.slack_wh_url,
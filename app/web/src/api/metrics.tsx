@@ -40,7 +40,8 @@ export class MetricsService implements Metrics {
             },
             {
                 size: 0,
-                from_: 0
+                from_: 0,
+                ...(app_env ? {app_env: app_env} : {})
             }
         )
     }
@@ -45,7 +45,8 @@ export class StatsService implements Stats {
             },
             {
                 size: 0,
-                from_: 0
+                from_: 0,
+                ...(app_env ? {app_env: app_env} : {})
             }
         )
     }
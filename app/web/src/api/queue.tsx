@@ -39,7 +39,8 @@ export class QueueService implements Queue {
             },
             {
                 size: 0,
-                from_: 0
+                from_: 0,
+                ...(app_env ? {app_env: app_env} : {})
             }
         )
     }
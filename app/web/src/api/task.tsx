@@ -104,6 +104,9 @@ export interface Task {
     ): any;
 }
 
+// Tasks are counted up to this bound, so latest tasks searches can stop early
+export const MAX_COUNTED_TASKS = 1000;
+
 export class TaskService implements Task {
     filter(
         app_name: string,
@@ -127,7 +130,9 @@ export class TaskService implements Task {
             },
             {
                 size: size,
-                from_: from_
+                from_: from_,
+                track_total_hits: MAX_COUNTED_TASKS,
+                ...(app_env ? {app_env: app_env} : {})
             }
         )
     }
@@ -31,7 +31,10 @@ interface TasksFilterContextData {
 }
 
 const TaskAttributesFilter: React.FC<TasksFilterContextData> = (props: TasksFilterContextData) => {
-    const {seenTasks, seenWorkers, seenTaskStates, seenRoutingKeys, seenQueues} = useApplication();
+    const {seenTasks, seenWorkers, seenTaskStates, seenRoutingKeys, seenQueues, applications, currentApp} = useApplication();
+    // Payloads are not indexed by the lean mapping profile
+    const currentApplication = applications.find(app => app.app_name === currentApp);
+    const payloadsIndexed = !currentApplication || currentApplication.mapping_profile !== "lean";
     const [form] = Form.useForm();
 
     // UI Callbacks
@@ -155,26 +158,28 @@ const TaskAttributesFilter: React.FC<TasksFilterContextData> = (props: TasksFilt
                         <Input placeholder="Exception" allowClear/>
                     </FormItem>
                 </Row>
-                <Row>
-                    <FormItem name="traceback" style={{width: "100%"}}>
-                        <Input placeholder="Traceback" allowClear/>
-                    </FormItem>
-                </Row>
-                <Row>
-                    <FormItem name="args" style={{width: "100%"}}>
-                        <Input placeholder="args" allowClear/>
-                    </FormItem>
-                </Row>
-                <Row>
-                    <FormItem name="kwargs" style={{width: "100%"}}>
-                        <Input placeholder="kwargs" allowClear/>
-                    </FormItem>
-                </Row>
-                <Row>
-                    <FormItem name="result" style={{width: "100%"}}>
-                        <Input placeholder="Result" allowClear/>
-                    </FormItem>
-                </Row>
+                {payloadsIndexed && <>
+                    <Row>
+                        <FormItem name="traceback" style={{width: "100%"}}>
+                            <Input placeholder="Traceback" allowClear/>
+                        </FormItem>
+                    </Row>
+                    <Row>
+                        <FormItem name="args" style={{width: "100%"}}>
+                            <Input placeholder="args" allowClear/>
+                        </FormItem>
+                    </Row>
+                    <Row>
+                        <FormItem name="kwargs" style={{width: "100%"}}>
+                            <Input placeholder="kwargs" allowClear/>
+                        </FormItem>
+                    </Row>
+                    <Row>
+                        <FormItem name="result" style={{width: "100%"}}>
+                            <Input placeholder="Result" allowClear/>
+                        </FormItem>
+                    </Row>
+                </>}
                 <Row>
                     <FormItem name="revocation_reason" style={{width: "100%"}}>
                         <Select placeholder="Revocation reason" allowClear>
@@ -152,6 +152,13 @@ const Triggers = (props) => {
             />
         </FormItem>
 
+        <FormItem name="aggregation_window">
+            <InputNumber style={{width: '100%'}}
+                         min={0} max={3600} step={1}
+                         placeholder="Aggregation window in seconds (One digest per task name/state/exception)"
+            />
+        </FormItem>
+
         <FormItem name="patterns" valuePropName="value">
             <Radio.Group buttonStyle="solid" onChange={e => setPatternType(e.target.value)}>
                 <Radio.Button value="all">All tasks</Radio.Button>
@@ -19,6 +19,7 @@ interface ApplicationContextData {
         created_at: number
         owner: string,
         fo_triggers: [any]
+        mapping_profile?: string
     }[];
     currentApp: string | undefined;
     currentEnv: string | undefined;
@@ -10,7 +10,7 @@ import TimeFilter from '../components/filters/TaskTimeFilter'
 import TaskDetailsDrawer from '../containers/tasks/TaskDetailsDrawer'
 
 import {useApplication} from "../context/ApplicationProvider"
-import {TaskService} from "../api/task"
+import {TaskService, MAX_COUNTED_TASKS} from "../api/task"
 import {handleAPIError, handleAPIResponse} from "../utils/errors"
 import {fixPagination} from "../utils/pagination";
 
@@ -119,6 +119,7 @@ const TasksPage: React.FC = () => {
     }
 
     function handleShowTotal(total) {
+        if (total >= MAX_COUNTED_TASKS) return `More than ${MAX_COUNTED_TASKS} tasks`;
         return `Total of ${total} tasks`;
     }
 
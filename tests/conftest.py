@@ -0,0 +1,34 @@
+import os
+import sys
+
+import pytest
+
+# API settings read these variables at import time
+os.environ.setdefault("LEEK_API_OWNER_ORG", "ramp.com")
+os.environ.setdefault("LEEK_FIREBASE_PROJECT_ID", "kodhive-leek")
+os.environ.setdefault("LEEK_WEB_URL", "http://0.0.0.0:8000")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "app"))
+
+
+class Clock:
+    """
+    Replaces the time module of the module under test, time only moves when the test advances it
+    """
+
+    def __init__(self, now=1000.):
+        self.now = now
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return Clock()
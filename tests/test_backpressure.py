@@ -0,0 +1,38 @@
+import pytest
+
+from leek.api import backpressure
+from leek.api.backpressure import IngestionPressure
+
+
+@pytest.fixture
+def pressure(monkeypatch, clock):
+    monkeypatch.setattr(backpressure, "time", clock)
+    return IngestionPressure(max_inflight=4, max_latency_s=1, max_retry_after_s=3)
+
+
+def test_load_follows_inflight_requests(pressure):
+    assert pressure.load() == 0
+    for _ in range(4):
+        pressure.enter()
+    assert pressure.load() == 1
+    pressure.exit()
+    assert pressure.load() == 0.75
+
+
+def test_latency_is_smoothed_and_decays(pressure, clock):
+    pressure.record_latency(1)
+    assert pressure.load() == pytest.approx(IngestionPressure.LATENCY_SMOOTHING)
+    clock.sleep(IngestionPressure.LATENCY_WINDOW_S / 2)
+    assert pressure.load() == pytest.approx(IngestionPressure.LATENCY_SMOOTHING / 2)
+    clock.sleep(IngestionPressure.LATENCY_WINDOW_S / 2)
+    assert pressure.load() == 0
+
+
+def test_retry_after_grows_with_load_and_is_bounded(pressure):
+    assert pressure.retry_after() == 1
+    for _ in range(8):
+        pressure.enter()
+    assert pressure.retry_after() == 2
+    for _ in range(8):
+        pressure.enter()
+    assert pressure.retry_after() == 3
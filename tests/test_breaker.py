@@ -0,0 +1,62 @@
+import pytest
+
+from leek.api.ext import breaker as breaker_module
+from leek.api.ext.breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+
+
+@pytest.fixture
+def breaker(monkeypatch, clock):
+    monkeypatch.setattr(breaker_module, "time", clock)
+    return CircuitBreaker(error_rate=0.5, min_calls=4, window_s=10, slow_call_s=1, open_s=5)
+
+
+def test_opens_on_error_rate_after_min_calls(breaker):
+    breaker.record(True, 0)
+    breaker.record(True, 0)
+    breaker.record(False, 0)
+    assert breaker.state == CLOSED
+    breaker.record(False, 0)
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+
+def test_slow_calls_count_as_failures(breaker):
+    for _ in range(4):
+        breaker.record(False, 2)
+    assert breaker.state == OPEN
+
+
+def test_calls_out_of_window_are_ignored(breaker, clock):
+    breaker.record(True, 0)
+    breaker.record(True, 0)
+    clock.sleep(11)
+    breaker.record(False, 0)
+    breaker.record(False, 0)
+    breaker.record(True, 0)
+    breaker.record(False, 0)
+    assert breaker.state == CLOSED
+
+
+def test_half_open_lets_one_probe_through(breaker, clock):
+    for _ in range(4):
+        breaker.record(True, 0)
+    assert breaker.retry_after() == 5
+    clock.sleep(5)
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    breaker.record(False, 0)
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_failed_probe_opens_again(breaker, clock):
+    for _ in range(4):
+        breaker.record(True, 0)
+    clock.sleep(5)
+    assert breaker.allow()
+    breaker.record(True, 0)
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    clock.sleep(5)
+    assert breaker.allow()
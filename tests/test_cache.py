@@ -0,0 +1,53 @@
+from leek.api import cache
+from leek.api.cache import TTLCache
+
+
+def test_get_set_pop():
+    entries = TTLCache(maxsize=10, ttl=60)
+    assert entries.get("a") is None
+    assert entries.get("a", "default") == "default"
+    entries.set("a", 1)
+    assert entries.get("a") == 1
+    assert "a" in entries
+    assert entries.pop("a") == 1
+    assert "a" not in entries
+    assert entries.pop("a", "default") == "default"
+
+
+def test_entries_expire(monkeypatch, clock):
+    monkeypatch.setattr(cache, "time", clock)
+    entries = TTLCache(maxsize=10, ttl=60)
+    entries.set("a", 1)
+    entries.set("b", 2, ttl=5)
+    clock.sleep(5)
+    assert entries.get("b") is None
+    assert entries.get("a") == 1
+    clock.sleep(55)
+    assert entries.get("a") is None
+    assert len(entries) == 0
+
+
+def test_least_recently_used_entries_are_evicted():
+    entries = TTLCache(maxsize=2, ttl=60)
+    entries.set("a", 1)
+    entries.set("b", 2)
+    entries.get("a")
+    entries.set("c", 3)
+    assert "b" not in entries
+    assert entries.get("a") == 1
+    assert entries.get("c") == 3
+
+
+def test_falsy_values_are_cached():
+    entries = TTLCache(maxsize=10, ttl=60)
+    entries.set("missing", None)
+    assert "missing" in entries
+
+
+def test_pop_matching_evicts_selected_entries():
+    entries = TTLCache(maxsize=10, ttl=60)
+    for key in (("org-app", "t1"), ("org-app.prod", "t2"), ("org-application", "t3")):
+        entries.set(key, "index")
+    entries.pop_matching(lambda key: key[0] == "org-app" or key[0].startswith("org-app."))
+    assert len(entries) == 1
+    assert ("org-application", "t3") in entries
@@ -0,0 +1,15 @@
+from leek.api.errors import responses
+from leek.api.idempotency import select_retried, not_written
+
+
+def test_select_retried_keeps_failed_docs_events():
+    events = {"t1": ["e1"], "t2": ["e2"], "t3": ["e3"]}
+    assert select_retried(events, None) is events
+    assert select_retried(events, ["t2", "t4"]) == {"t2": ["e2"]}
+    assert select_retried(events, []) == {}
+
+
+def test_not_written_reads_partial_failures_only():
+    assert not_written(responses.events_not_written({"org-app": ["t1"], "org-app.prod": ["t2"]})) == ["t1", "t2"]
+    assert not_written(("Processed", 201)) is None
+    assert not_written(responses.cache_backend_unavailable) is None
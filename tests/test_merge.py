@@ -0,0 +1,78 @@
+import copy
+import random
+
+from leek.api.db.merge import group_events, merge_groups, fold, fold_many
+from leek.api.db.store import Task, QUEUED, RECEIVED, STARTED, SUCCEEDED
+
+
+def task(state, timestamp, uuid="t1", **fields):
+    return Task(id=uuid, app_env="prod", kind="task", state=state, clock=timestamp, timestamp=timestamp,
+                exact_timestamp=float(timestamp), utcoffset=0, pid=1, uuid=uuid, **fields)
+
+
+def lifecycle(uuid="t1"):
+    return [
+        task(QUEUED, 1, uuid, name="reports.build", args="(1,)", queue="default"),
+        task(RECEIVED, 2, uuid, name="reports.build", args="(1,)"),
+        task(STARTED, 3, uuid, worker="worker@host"),
+        task(SUCCEEDED, 4, uuid, result="ok", runtime=0.5),
+    ]
+
+
+def merge_one_by_one(events, base=None):
+    events = copy.deepcopy(events)
+    if base is None:
+        base, events = events[0], events[1:]
+    for event in events:
+        base.merge(event)
+    return base
+
+
+def test_group_events_orders_each_group():
+    events = lifecycle("t1") + lifecycle("t2")
+    random.Random(7).shuffle(events)
+    groups = group_events(events)
+    assert set(groups.keys()) == {"t1", "t2"}
+    for group in groups.values():
+        assert [e.state for e in group] == [QUEUED, RECEIVED, STARTED, SUCCEEDED]
+
+
+def test_merge_groups_keeps_order():
+    events = lifecycle()
+    target = group_events(events[::2])
+    merge_groups(target, group_events(events[1::2]))
+    assert [e.state for e in target["t1"]] == [QUEUED, RECEIVED, STARTED, SUCCEEDED]
+
+
+def test_fold_matches_sequential_merge():
+    events = lifecycle()
+    expected = merge_one_by_one(events)
+    shuffled = copy.deepcopy(events)
+    random.Random(3).shuffle(shuffled)
+    folded = fold(group_events(shuffled)["t1"])
+    assert folded == expected
+    assert folded.state == SUCCEEDED
+    assert folded.events_count == 4
+    assert folded.name == "reports.build"
+
+
+def test_fold_into_indexed_doc_matches_sequential_merge():
+    events = lifecycle()
+    indexed = merge_one_by_one(events[:2])
+    expected = merge_one_by_one(events[2:], base=copy.deepcopy(indexed))
+    assert fold(copy.deepcopy(events[2:]), base=copy.deepcopy(indexed)) == expected
+
+
+def test_fold_many_uses_indexed_source_then_remembered_doc():
+    events = lifecycle()
+    indexed = merge_one_by_one(events[:2])
+    _, source = indexed.to_doc()
+    remembered = merge_one_by_one(lifecycle("t2")[:2])
+    docs = fold_many([
+        ("t1", copy.deepcopy(source), None, copy.deepcopy(events[2:])),
+        ("t2", None, copy.deepcopy(remembered), lifecycle("t2")[2:]),
+        ("t3", None, None, lifecycle("t3")),
+    ])
+    assert docs[0] == merge_one_by_one(events[2:], base=copy.deepcopy(indexed))
+    assert docs[1] == merge_one_by_one(lifecycle("t2")[2:], base=copy.deepcopy(remembered))
+    assert docs[2] == merge_one_by_one(lifecycle("t3"))
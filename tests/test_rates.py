@@ -0,0 +1,53 @@
+import pytest
+
+from leek.api.channels import rates
+from leek.api.channels.rates import SlidingWindowCounters, STATES_FAILURE
+from leek.api.db.store import Task, Worker, STATES_TERMINAL, SUCCEEDED, FAILED, STARTED, RECEIVED
+
+
+def task(uuid, state, name="reports.build"):
+    return Task(id=uuid, app_env="prod", kind="task", state=state, clock=1, timestamp=1, exact_timestamp=1.,
+                utcoffset=0, pid=1, uuid=uuid, name=name)
+
+
+@pytest.fixture
+def counters(monkeypatch, clock):
+    monkeypatch.setattr(rates, "time", clock)
+    return SlidingWindowCounters(bucket_s=10, horizon_s=60)
+
+
+KEY = ("org-app", "prod", "reports.build")
+
+
+def test_only_completed_tasks_are_counted(counters):
+    worker = Worker(id="w1", app_env="prod", kind="worker", state="HEARTBEAT", clock=1, timestamp=1,
+                    exact_timestamp=1., utcoffset=0, pid=1, hostname="w1")
+    counters.record("org-app", "prod", [task("t1", SUCCEEDED), task("t2", FAILED), task("t3", STARTED), worker])
+    assert counters.count(KEY, STATES_TERMINAL, 0, 60) == 2
+    assert counters.count(KEY, STATES_FAILURE, 0, 60) == 1
+    assert counters.keys("org-app") == [KEY]
+    assert counters.keys("org-other") == []
+
+
+def test_docs_rewritten_by_late_events_are_not_counted_again(counters):
+    doc = task("t1", SUCCEEDED)
+    counters.record("org-app", "prod", [doc], {"t1": [task("t1", SUCCEEDED)]})
+    # Late task-received event, the merged doc is still SUCCEEDED
+    counters.record("org-app", "prod", [doc], {"t1": [task("t1", RECEIVED)]})
+    assert counters.count(KEY, STATES_TERMINAL, 0, 60) == 1
+
+
+def test_windows_are_summed_from_buckets(counters, clock):
+    counters.record("org-app", "prod", [task("t1", SUCCEEDED)])
+    clock.sleep(30)
+    counters.record("org-app", "prod", [task("t2", SUCCEEDED), task("t3", SUCCEEDED)])
+    assert counters.count(KEY, STATES_TERMINAL, 0, 20) == 2
+    assert counters.count(KEY, STATES_TERMINAL, 20, 40) == 1
+    assert counters.count(KEY, STATES_TERMINAL, 0, 60) == 3
+
+
+def test_prune_drops_buckets_out_of_horizon(counters, clock):
+    counters.record("org-app", "prod", [task("t1", SUCCEEDED)])
+    clock.sleep(70)
+    counters.prune()
+    assert counters.keys("org-app") == []
@@ -0,0 +1,65 @@
+import zlib
+
+import pytest
+
+from leek.api import sampling
+from leek.api.sampling import AdaptiveSampler
+from leek.api.db.store import Task, Worker, SamplingRule, SUCCEEDED, FAILED, STARTED
+
+RULES = [SamplingRule(task_name=r"^reports\.", target_rate=1, slow_runtime=10)]
+
+
+def task(uuid, state=SUCCEEDED, name="reports.build", **fields):
+    return Task(id=uuid, app_env="prod", kind="task", state=state, clock=1, timestamp=1, exact_timestamp=1.,
+                utcoffset=0, pid=1, uuid=uuid, name=name, **fields)
+
+
+@pytest.fixture
+def sampler(monkeypatch, clock):
+    monkeypatch.setattr(sampling, "time", clock)
+    return AdaptiveSampler(remember_size=10, remember_ttl=60)
+
+
+def grow_n(sampler, clock, successes_per_second):
+    """
+    Observe successes over an adjustment interval, so N follows the observed rate
+    """
+    sampler.get_n("org-app", RULES[0])
+    clock.sleep(AdaptiveSampler.ADJUST_INTERVAL_S)
+    return sampler.get_n("org-app", RULES[0], observed=successes_per_second * AdaptiveSampler.ADJUST_INTERVAL_S)
+
+
+def test_unmatched_docs_are_not_sampled(sampler):
+    assert sampler.sample("org-app", RULES, task("t1", name="emails.send")) is None
+    worker = Worker(id="w1", app_env="prod", kind="worker", state="HEARTBEAT", clock=1, timestamp=1,
+                    exact_timestamp=1., utcoffset=0, pid=1, hostname="w1")
+    assert sampler.sample("org-app", RULES, worker) is None
+
+
+def test_n_is_a_power_of_two_following_the_rate(sampler, clock):
+    assert sampler.get_n("org-app", RULES[0]) == 1
+    assert grow_n(sampler, clock, 6) == 8
+    assert grow_n(sampler, clock, 0.5) == 1
+
+
+def test_failures_retries_and_slow_runs_are_kept(sampler, clock):
+    grow_n(sampler, clock, 64)
+    assert sampler.sample("org-app", RULES, task("t1", state=FAILED)) == 1
+    assert sampler.sample("org-app", RULES, task("t2", retries=1)) == 1
+    assert sampler.sample("org-app", RULES, task("t3", runtime=12)) == 1
+
+
+def test_decision_is_stable_for_all_events_of_a_task(sampler, clock):
+    n = grow_n(sampler, clock, 8)
+    for uuid in (f"t{i}" for i in range(50)):
+        weight = sampler.sample("org-app", RULES, task(uuid))
+        assert weight == (n if zlib.crc32(uuid.encode("utf-8")) % n == 0 else 0)
+        assert sampler.sample("org-app", RULES, task(uuid, state=STARTED)) == weight
+
+
+def test_dropped_docs_are_recalled_once(sampler):
+    doc = task("t1")
+    sampler.remember("org-app", doc)
+    assert sampler.recall("org-app.prod", "t1") is None
+    assert sampler.recall("org-app", "t1") is doc
+    assert sampler.recall("org-app", "t1") is None
@@ -0,0 +1,85 @@
+import threading
+import time
+
+import pytest
+
+from leek.api import tenants
+from leek.api.db.store import IngestionQuota
+from leek.api.tenants import TokenBucket, TenantQuotas, FairScheduler
+
+
+def test_token_bucket_allows_debt(monkeypatch, clock):
+    monkeypatch.setattr(tenants, "time", clock)
+    bucket = TokenBucket(rate=10, burst_s=1)
+    assert bucket.wait_time() == 0
+    bucket.consume(15)
+    # 5 tokens of debt, plus one token to be admitted again
+    assert bucket.wait_time() == pytest.approx(0.6)
+    clock.sleep(0.6)
+    assert bucket.wait_time() == 0
+
+
+def test_quotas_throttle_and_count_usage(monkeypatch, clock):
+    monkeypatch.setattr(tenants, "time", clock)
+    quotas = TenantQuotas(burst_s=1)
+    quota = IngestionQuota(events_per_second=10)
+    assert quotas.admit("org-app", quota, 15, 100) == 0
+    assert quotas.admit("org-app", quota, 1, 10) > 0
+    assert quotas.admit("org-other", None, 1000, 10) == 0
+    assert quotas.usage() == {
+        "org-app": {"requests": 1, "events": 15, "bytes": 100, "throttled_requests": 1},
+        "org-other": {"requests": 1, "events": 1000, "bytes": 10, "throttled_requests": 0},
+    }
+
+
+def test_quota_change_resets_bucket(monkeypatch, clock):
+    monkeypatch.setattr(tenants, "time", clock)
+    quotas = TenantQuotas(burst_s=1)
+    assert quotas.admit("org-app", IngestionQuota(events_per_second=10), 15, 0) == 0
+    assert quotas.admit("org-app", IngestionQuota(events_per_second=20), 15, 0) == 0
+
+
+def test_scheduler_disabled_without_slots():
+    scheduler = FairScheduler(slots=0, quantum=100, max_wait_s=0)
+    assert all(scheduler.acquire("org-app", 1) for _ in range(10))
+
+
+def test_scheduler_gives_up_after_max_wait():
+    scheduler = FairScheduler(slots=1, quantum=100, max_wait_s=0.01)
+    assert scheduler.acquire("org-app", 1)
+    assert not scheduler.acquire("org-app", 1)
+    assert scheduler.stats() == {"busy_slots": 1, "queued": {}}
+    scheduler.release()
+    assert scheduler.stats() == {"busy_slots": 0, "queued": {}}
+
+
+def wait_until(predicate, timeout_s=5):
+    deadline = time.monotonic() + timeout_s
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def test_scheduler_grants_waiting_applications_in_round_robin():
+    scheduler = FairScheduler(slots=1, quantum=100, max_wait_s=5)
+    assert scheduler.acquire("org-busy", 100)
+    granted = []
+
+    def ingest(index_alias, name):
+        assert scheduler.acquire(index_alias, 100)
+        granted.append(name)
+
+    threads = []
+    # Queued in this order, a FIFO would grant busy-1, busy-2 then quiet-1
+    for index_alias, name in (("org-busy", "busy-1"), ("org-busy", "busy-2"), ("org-quiet", "quiet-1")):
+        thread = threading.Thread(target=ingest, args=(index_alias, name), daemon=True)
+        thread.start()
+        threads.append(thread)
+        queued = len(threads)
+        wait_until(lambda: sum(scheduler.stats()["queued"].values()) == queued)
+    for count in range(1, 4):
+        scheduler.release()
+        wait_until(lambda: len(granted) == count)
+    for thread in threads:
+        thread.join(timeout=5)
+    assert granted == ["busy-1", "quiet-1", "busy-2"]
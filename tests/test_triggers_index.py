@@ -0,0 +1,41 @@
+from leek.api.db.store import FanoutTrigger, TriggersIndex, FAILED, SUCCEEDED
+
+
+def trigger(_id, enabled=True, **fields):
+    return FanoutTrigger(id=_id, enabled=enabled, slack_wh_url="https://hooks.slack.com/services/x", **fields)
+
+
+def ids(triggers):
+    return sorted(t.id for t in triggers)
+
+
+def test_disabled_and_rate_triggers_are_not_indexed():
+    index = TriggersIndex([
+        trigger("disabled", enabled=False),
+        trigger("rate", rate={"metric": "failure_rate", "threshold": 0.5}),
+    ])
+    assert len(index) == 0
+    assert index.lookup("prod", FAILED) == []
+
+
+def test_lookup_matches_specific_and_wildcard_triggers():
+    index = TriggersIndex([
+        trigger("any"),
+        trigger("prod-failed", envs=["prod"], states=[FAILED]),
+        trigger("prod", envs=["prod"]),
+        trigger("failed", states=[FAILED]),
+    ])
+    assert ids(index.lookup("prod", FAILED)) == ["any", "failed", "prod", "prod-failed"]
+    assert ids(index.lookup("prod", SUCCEEDED)) == ["any", "prod"]
+    assert ids(index.lookup("qa", FAILED)) == ["any", "failed"]
+    assert ids(index.lookup("qa", SUCCEEDED)) == ["any"]
+
+
+def test_names_are_matched_against_exclusions_then_inclusions():
+    matcher = trigger("t", exclude=[r"reports\.internal"], include=[r"reports\.", r"emails\."])
+    assert matcher.matches_name("reports.build")
+    assert matcher.matches_name("emails.send")
+    assert not matcher.matches_name("reports.internal.cleanup")
+    assert not matcher.matches_name("billing.charge")
+    assert not matcher.matches_name(None)
+    assert trigger("all").matches_name(None)